@@ -1,10 +1,6 @@
-import matplotlib
-matplotlib.use('Agg')
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import smtplib
 import time
 import random
@@ -15,6 +11,9 @@ import threading
 from datetime import datetime
 import json
 import os
+from price_cache import get_price_cache, load_price_frame, history_version
+from price_store import get_price_store, WriteVersion
+from price_alerts import get_price_alerts
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -143,15 +142,22 @@ def save_price_data(product_id, price):
     df = pd.DataFrame([[timestamp, price]], columns=['Timestamp', 'Price'])
 
     try:
-        if os.path.exists(filename):
-            df_old = pd.read_csv(filename)
-            df = pd.concat([df_old, df], ignore_index=True)
-            logger.info(f"Updated price history for {product_id}")
-        else:
-            logger.info(f"Creating new price history file for {product_id}")
-
-        df.to_csv(filename, index=False)
+        # Append the new row so existing rows (and their time index offsets) stay put
+        with get_price_store().write_lock:
+            before = history_version(product_id)
+            if os.path.exists(filename):
+                df.to_csv(filename, mode='a', header=False, index=False)
+                logger.info(f"Updated price history for {product_id}")
+            else:
+                df.to_csv(filename, index=False)
+                logger.info(f"Creating new price history file for {product_id}")
+            version = WriteVersion(before, history_version(product_id))
+
+        get_price_cache().invalidate(product_id)
         logger.info(f"Price recorded for {product_id}: {price}")
+
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+        get_price_store().notify(product_id, df, version)
     except Exception as e:
         logger.error(f"Error saving price data: {e}")
 
@@ -164,29 +170,19 @@ def analyze_prices(product_id):
             logger.error(f"No data available for product {product_id}")
             return None, None, None
 
-        df = pd.read_csv(filename)
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-        avg_price = df['Price'].mean()
-        max_price = df['Price'].max()
-        min_price = df['Price'].min()
+        # The frame is only loaded on a miss, so stats restored from the snapshot skip the parse
+        def compute_stats():
+            df = load_price_frame(product_id)
+            return df['Price'].mean(), df['Price'].max(), df['Price'].min()
+
+        avg_price, max_price, min_price = get_price_cache().get(product_id, 'stats', compute_stats)
 
         logger.info(f"Price analysis for {product_id}:")
         logger.info(f"Average: ${avg_price:.2f}")
         logger.info(f"Maximum: ${max_price:.2f}")
         logger.info(f"Minimum: ${min_price:.2f}")
 
-        # Plot Price Trend
-        sns.set_style("darkgrid")
-        plt.figure(figsize=(10, 5))
-        sns.lineplot(data=df, x='Timestamp', y='Price', marker='o')
-        plt.title(f"Price Trend for {product_id}")
-        plt.xlabel("Date")
-        plt.ylabel("Price")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f"static/price_trend_{product_id}.png")
-        plt.close()
-
+        # Charts are rendered on demand by chart_renderer, never on the scrape path
         return avg_price, max_price, min_price
     except Exception as e:
         logger.error(f"Error analyzing prices for {product_id}: {e}")
@@ -254,11 +250,7 @@ def start_continuous_scraping(product_data, interval_minutes=2):
                         
                         # Save updated product data
                         save_product_data(product_data)
-                        
-                        # Check for significant price changes
-                        if current_price < data.get('min_price', float('inf')):
-                            logger.info(f"Price drop detected for {product_id}")
-                            # Add your notification logic here
+                        # Drops and spikes are flagged to price alert subscribers as the price is saved
                     
                     # Add random delay between requests to avoid rate limiting
                     time.sleep(random.uniform(5, 10))
@@ -289,14 +281,21 @@ def check_and_notify(url, recipient_email, sender_email, sender_password):
         return product_name, None, None, None, None
 
     if current_price is not None:
+        saved_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         save_price_data(product_id, current_price)
         avg_price, max_price, min_price = analyze_prices(product_id)
 
-        # Send Email if Price Drops
-        if current_price == min_price:
+        # Send Email if the detector flagged this price as a drop or a new low
+        events = [e for e in get_price_alerts().recent_events(product_id, since=saved_at)
+                  if e['type'] in ('price_drop', 'new_low')]
+        if events:
+            if any(e['type'] == 'new_low' for e in events):
+                body = f"The product is at its lowest price: ${current_price}"
+            else:
+                body = f"The price dropped {abs(events[0]['change_pct'])}% below its recent average of ${events[0]['baseline']}: ${current_price}"
             send_email(
                 f"Price Drop Alert for {product_name}!",
-                f"The product is at its lowest price: ${current_price}",
+                body,
                 recipient_email, sender_email, sender_password
             )
 
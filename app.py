@@ -1,18 +1,30 @@
-from flask import Flask, render_template, jsonify, request, send_from_directory, redirect, url_for, flash
+from flask import Flask, render_template, jsonify, request, abort, redirect, url_for, flash, Response, stream_with_context
 from flask_login import login_required, current_user
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
 from datetime import datetime, timedelta
 import os
 import json
+import hmac
+import atexit
 from amazon_scraper import (
     get_product_details, save_price_data, analyze_prices, 
     get_product_id, save_product_data, load_product_data, start_continuous_scraping
 )
 from auth import init_auth, register_auth_routes, db, User
-from firebase_config import init_firebase, get_firebase_service
-from firebase_admin import firestore
+from firebase_config import init_firebase, get_firebase_service, USER_DATA_PAGE_SIZE
+from price_cache import get_price_cache, load_price_frame
+from price_store import get_price_store, to_epoch_seconds
+from chart_data import chart_series, encode_series, DEFAULT_CHART_POINTS, MAX_CHART_POINTS
+from bulk_ingest import ingest_stream, feed_format
+from price_sketch import get_price_sketches
+from chart_renderer import CHARTS_ENABLED, get_chart_renderer
+from static_assets import init_static_assets
+from forecast_table import get_forecast_table
+from negotiation import evaluate_offers, format_response
+from negotiation_sessions import get_negotiation_sessions
+from snapshot import load_snapshot, start_snapshot_writer
+from event_bus import get_event_bus
 import logging
 
 # Set up logging
@@ -21,6 +33,9 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='static')
 
+# Serve static files with content-hashed URLs and cache validation
+asset_url = init_static_assets(app)
+
 # Initialize authentication
 init_auth(app)
 
@@ -55,71 +70,109 @@ def save_data():
 
 def predict_price(product_id):
     try:
-        filename = f"price_history_{product_id}.csv"
-        if not os.path.exists(filename):
-            return []
-
-        df = pd.read_csv(filename)
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-        
-        # Prepare data for prediction
-        X = np.arange(len(df)).reshape(-1, 1)
-        y = df['Price'].values
-        
-        # Fit linear regression
-        model = LinearRegression()
-        model.fit(X, y)
-        
-        # Generate predictions for next 7 days
-        future_dates = np.arange(len(df), len(df) + 7).reshape(-1, 1)
-        predictions = model.predict(future_dates)
-        
-        # Create prediction dates
-        last_date = df['Timestamp'].iloc[-1]
-        prediction_dates = [last_date + timedelta(days=i+1) for i in range(7)]
-        
-        return list(zip(prediction_dates, predictions))
+        return get_forecast_table().lookup(product_id)
     except Exception as e:
         logger.error(f"Error predicting price: {e}")
         return []
 
-def get_price_history(product_id):
+def _history_payload(df):
+    return {
+        'dates': df['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist(),
+        'prices': df['Price'].tolist()
+    }
+
+def get_price_history(product_id, start=None, end=None, limit=None):
     try:
-        filename = f"price_history_{product_id}.csv"
-        if not os.path.exists(filename):
-            return {'dates': [], 'prices': []}
-        
-        df = pd.read_csv(filename)
-        return {
-            'dates': df['Timestamp'].tolist(),
-            'prices': df['Price'].tolist()
-        }
+        if start is not None or end is not None or limit is not None:
+            df = get_price_store().read_range(product_id, start=start, end=end, limit=limit)
+            return _history_payload(df) if df is not None else {'dates': [], 'prices': []}
+
+        # The frame is only loaded on a miss, so a payload restored from the snapshot skips the parse
+        def compute_history():
+            df = load_price_frame(product_id)
+            return _history_payload(df) if df is not None else {'dates': [], 'prices': []}
+        
+        return get_price_cache().get(product_id, 'history', compute_history)
     except Exception as e:
         logger.error(f"Error getting price history: {e}")
         return {'dates': [], 'prices': []}
 
-def negotiate_price(product_id, offer):
-    if product_id not in product_data:
-        return {"response": "❌ Sorry, product not found."}
-
+def parse_history_range(args):
+    """Parse start/end/limit query parameters, raising ValueError on bad input"""
+    start = pd.Timestamp(args['start']) if args.get('start') else None
+    end = pd.Timestamp(args['end']) if args.get('end') else None
+    limit = int(args['limit']) if args.get('limit') else None
+    if limit is not None and limit <= 0:
+        raise ValueError("limit must be a positive integer")
+    if start is not None and end is not None and start > end:
+        raise ValueError("start must not be after end")
+    return start, end, limit
+
+def _negotiation_terms(product_id):
     product = product_data[product_id]
     price = float(product["current_price"])
-    min_price = float(product["min_price"]) if "min_price" in product else price * 0.85  # fallback 15% discount
-
-    if offer >= price:
-        return {"response": f"✅ Great! The {product['name']} is yours for ₹{price}"}
-
-    if offer >= price * 0.9:  # 90%+
-        return {"response": f"🎉 Deal! I can give you the {product['name']} for ₹{offer}"}
+    # No recorded minimum is passed as NaN; evaluate_offers then uses a 15% discount as the floor
+    min_price = float(product["min_price"]) if "min_price" in product else np.nan
+    return price, min_price
 
-    if offer >= price * 0.7:  # 70–90%
-        counter = max((offer + price) // 2, min_price)
-        return {"response": f"🤝 Hmm, I can’t do ₹{offer}, but how about ₹{counter}?"}
+def negotiate_price(product_id, offer, user_id=None):
+    if product_id not in product_data:
+        return {"response": "❌ Sorry, product not found."}
 
-    if offer < price * 0.7:  # Too low
-        return {"response": f"😅 That’s too low. Best I can do is ₹{min_price}"}
+    product = product_data[product_id]
 
-    return {"response": "Let's discuss further!"}
+    # Where the offer sits among the prices this product has actually sold for
+    offer_percentile = get_price_sketches().percentile(product_id, offer)
+    if offer_percentile is not None:
+        offer_percentile = round(offer_percentile, 1)
+
+    if user_id is None:
+        price, min_price = _negotiation_terms(product_id)
+        outcomes, amounts = evaluate_offers([price], [min_price], [offer])
+        response = format_response(outcomes[0], product['name'], offer, amounts.tolist()[0])
+        return {"response": response, "offer_percentile": offer_percentile}
+
+    # Within a session, earlier rounds decide how far the seller will still move
+    session, outcome, amount = get_negotiation_sessions().offer(
+        user_id, product_id, offer, lambda: _negotiation_terms(product_id)
+    )
+    return {
+        "response": format_response(outcome, product['name'], offer, amount),
+        "offer_percentile": offer_percentile,
+        "session": session.state()
+    }
+
+def persist_negotiation_session(session):
+    """Store one summary record per negotiation session once it closes"""
+    if not firebase_initialized:
+        return
+    firebase_service = get_firebase_service()
+    summary = session.summary()
+    with firebase_service.batch() as batch:
+        firebase_service.save_negotiation(session.user_id, session.product_id, {
+            **summary,
+            'product_name': product_data.get(session.product_id, {}).get('name', 'Unknown'),
+            'negotiation_type': 'price_negotiation_session'
+        }, batch=batch)
+        firebase_service.save_user_activity(session.user_id, 'negotiation_session', {
+            'product_id': session.product_id,
+            'rounds': summary['rounds'],
+            'outcome': summary['outcome'],
+            'final_price': summary['final_price'],
+            'success': summary['outcome'] == 'accepted'
+        }, batch=batch)
+
+get_negotiation_sessions().on_close(persist_negotiation_session)
+
+def parse_offer(value):
+    """Offer as a positive finite float, or None if it isn't one"""
+    if isinstance(value, bool):
+        return None
+    try:
+        offer = float(value)
+    except (TypeError, ValueError):
+        return None
+    return offer if np.isfinite(offer) and offer > 0 else None
 
 @app.route("/chat", methods=["POST"])
 @login_required
@@ -131,43 +184,119 @@ def chat():
 
         if not product_id or offer is None:
             return jsonify({"response": "❌ Missing product_id or offer"}), 400
+        offer = parse_offer(offer)
+        if offer is None:
+            return jsonify({"response": "❌ Offer must be a positive number"}), 400
 
-        result = negotiate_price(product_id, float(offer))
-        
-        # Store negotiation data in Firebase
-        if firebase_initialized:
-            firebase_service = get_firebase_service()
-            
-            # Save negotiation
-            firebase_service.save_negotiation(current_user.id, product_id, {
-                'user_offer': float(offer),
-                'ai_response': result.get('response', ''),
-                'product_name': product_data.get(product_id, {}).get('name', 'Unknown'),
-                'current_price': product_data.get(product_id, {}).get('current_price', 0),
-                'negotiation_type': 'price_negotiation'
-            })
-            
-            # Save user input
-            firebase_service.save_user_input(current_user.id, 'negotiation_offer', {
-                'product_id': product_id,
-                'offer_amount': float(offer),
-                'product_name': product_data.get(product_id, {}).get('name', 'Unknown')
-            })
-            
-            # Save user activity
-            firebase_service.save_user_activity(current_user.id, 'negotiation_attempt', {
-                'product_id': product_id,
-                'offer_amount': float(offer),
-                'ai_response': result.get('response', ''),
-                'success': '✅' in result.get('response', '')
-            })
-        
+        # Rounds are logged once, as a session summary, when the session closes
+        result = negotiate_price(product_id, offer, user_id=current_user.id)
         return jsonify(result)
 
     except Exception as e:
         logger.error(f"Error in chat: {e}")
         return jsonify({"response": "⚠️ Something went wrong"}), 500
 
+@app.route("/chat/end", methods=["POST"])
+@login_required
+def end_chat():
+    """Close the user's negotiation session for a product"""
+    product_id = (request.get_json(silent=True) or {}).get("product_id")
+    if not product_id:
+        return jsonify({"status": "error", "message": "Missing product_id"}), 400
+    session = get_negotiation_sessions().close(current_user.id, product_id)
+    if session is None:
+        return jsonify({"status": "error", "message": "No open negotiation for this product"}), 404
+    return jsonify({"status": "success", "session": session.summary()})
+
+
+MAX_BATCH_OFFERS = 1000
+
+@app.route("/chat_batch", methods=["POST"])
+@login_required
+def chat_batch():
+    """Evaluate many offers across many products in one request"""
+    try:
+        items = (request.get_json(silent=True) or {}).get("offers")
+        if not isinstance(items, list) or not items:
+            return jsonify({"status": "error", "message": "offers must be a non-empty list"}), 400
+
+        # Each item is {product_id, offer} where offer may also be a list of candidate prices.
+        # Malformed items fail the whole request; unknown products are reported per item.
+        product_ids, offers, errors, invalid = [], [], [], []
+        for index, item in enumerate(items):
+            product_id = item.get("product_id") if isinstance(item, dict) else None
+            candidates = item.get("offer") if isinstance(item, dict) else None
+            candidates = candidates if isinstance(candidates, list) else [candidates]
+            if not product_id or not candidates or any(c is None for c in candidates):
+                invalid.append({"index": index, "product_id": product_id, "response": "❌ Missing product_id or offer"})
+                continue
+            candidates = [parse_offer(c) for c in candidates]
+            if any(c is None for c in candidates):
+                invalid.append({"index": index, "product_id": product_id, "response": "❌ Offer must be a positive number"})
+                continue
+            if product_id not in product_data:
+                errors.append({"index": index, "product_id": product_id, "response": "❌ Sorry, product not found."})
+                continue
+            product_ids.extend([product_id] * len(candidates))
+            offers.extend(candidates)
+
+        if invalid:
+            return jsonify({"status": "error", "message": "Invalid offers", "errors": invalid}), 400
+
+        if len(offers) > MAX_BATCH_OFFERS:
+            return jsonify({"status": "error", "message": f"At most {MAX_BATCH_OFFERS} offers per request"}), 400
+
+        prices = [float(product_data[pid]["current_price"]) for pid in product_ids]
+        min_prices = [float(product_data[pid]["min_price"]) if "min_price" in product_data[pid] else np.nan for pid in product_ids]
+        outcomes, amounts = evaluate_offers(prices, min_prices, offers)
+        amounts = amounts.tolist()
+
+        # Percentiles per product, one sketch search each
+        percentiles = [None] * len(offers)
+        positions = {}
+        for i, pid in enumerate(product_ids):
+            positions.setdefault(pid, []).append(i)
+        for pid, indices in positions.items():
+            values = get_price_sketches().percentiles(pid, [offers[i] for i in indices])
+            if values is not None:
+                for i, value in zip(indices, values.tolist()):
+                    percentiles[i] = round(value, 1)
+
+        results = []
+        for i, pid in enumerate(product_ids):
+            results.append({
+                "product_id": pid,
+                "offer": offers[i],
+                "outcome": str(outcomes[i]),
+                "quoted_price": amounts[i],
+                "response": format_response(outcomes[i], product_data[pid]["name"], offers[i], amounts[i]),
+                "offer_percentile": percentiles[i]
+            })
+
+        # Store the whole batch in Firebase with one write
+        if firebase_initialized and results:
+            get_firebase_service().save_negotiation_batch(current_user.id, [
+                {
+                    'product_id': r['product_id'],
+                    'user_offer': r['offer'],
+                    'ai_response': r['response'],
+                    'product_name': product_data[r['product_id']].get('name', 'Unknown'),
+                    'current_price': product_data[r['product_id']].get('current_price', 0),
+                    'negotiation_type': 'batch_price_negotiation'
+                }
+                for r in results
+            ], {
+                'offer_count': len(results),
+                'product_ids': sorted(positions),
+                'accepted': sum(1 for r in results if r['outcome'] in ('accept_price', 'accept_offer'))
+            })
+
+        return jsonify({"status": "success", "results": results, "errors": errors})
+
+    except Exception as e:
+        logger.error(f"Error in batch chat: {e}")
+        return jsonify({"status": "error", "message": "⚠️ Something went wrong"}), 500
+
 
 @app.route('/')
 @login_required
@@ -221,52 +350,61 @@ def add_product():
         # Save data to file
         save_data()
         
-        # Store comprehensive data in Firebase
+        # Store comprehensive data in Firebase as one atomic update
+        firebase_error = None
         if firebase_initialized:
             firebase_service = get_firebase_service()
-            
-            # Save product data
-            firebase_service.save_product_data(product_id, product_data[product_id])
-            
-            # Save user input (URL submission)
-            firebase_service.save_user_input(current_user.id, 'product_url', {
-                'url': url,
-                'product_id': product_id,
-                'product_name': product_name
-            })
-            
-            # Save user activity
-            firebase_service.save_user_activity(current_user.id, 'product_added', {
-                'product_id': product_id,
-                'product_name': product_name,
-                'url': url,
-                'initial_price': current_price
-            })
-            
-            # Save price history
-            firebase_service.save_price_history(product_id, {
-                'price': current_price,
-                'price_type': 'initial',
-                'source': 'user_added'
-            })
-            
-            # Save product metadata
-            firebase_service.save_product_metadata(product_id, {
-                'name': product_name,
-                'url': url,
-                'category': 'amazon_product',
-                'added_by_user': current_user.id,
-                'added_at': datetime.now().isoformat()
-            })
-        
+            with firebase_service.batch() as batch:
+                # Save product data
+                firebase_service.save_product_data(product_id, product_data[product_id], batch=batch)
+                
+                # Save user input (URL submission)
+                firebase_service.save_user_input(current_user.id, 'product_url', {
+                    'url': url,
+                    'product_id': product_id,
+                    'product_name': product_name
+                }, batch=batch)
+                
+                # Save user activity
+                firebase_service.save_user_activity(current_user.id, 'product_added', {
+                    'product_id': product_id,
+                    'product_name': product_name,
+                    'url': url,
+                    'initial_price': current_price
+                }, batch=batch)
+                
+                # Save price history
+                firebase_service.save_price_history(product_id, {
+                    'price': current_price,
+                    'price_type': 'initial',
+                    'source': 'user_added'
+                }, batch=batch)
+                
+                # Save product metadata
+                firebase_service.save_product_metadata(product_id, {
+                    'name': product_name,
+                    'url': url,
+                    'category': 'amazon_product',
+                    'added_by_user': current_user.id,
+                    'added_at': datetime.now().isoformat()
+                }, batch=batch)
+            firebase_error = batch.error
+        
+        product = {
+            'id': product_id,
+            'name': product_name,
+            'current_price': current_price
+        }
+        if firebase_error is not None:
+            return jsonify({
+                'status': 'error',
+                'message': f'Product added locally, but saving it to Firebase failed: {firebase_error}',
+                'product': product
+            }), 502
         return jsonify({
             'status': 'success', 
             'message': 'Product added successfully',
-            'product': {
-                'id': product_id,
-                'name': product_name,
-                'current_price': current_price
-            }
+            'product': product
         })
     except Exception as e:
         logger.error(f"Error adding product: {e}")
@@ -279,8 +417,16 @@ def get_price_data(product_id):
         if product_id not in product_data:
             return jsonify({'error': 'Product not found'}), 404
         
+        try:
+            start, end, limit = parse_history_range(request.args)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid range: {e}'}), 400
+        
         product = product_data[product_id]
-        price_history = get_price_history(product_id)
+        if request.args.get('history', '1').lower() in ['0', 'false', 'off']:
+            price_history = None
+        else:
+            price_history = get_price_history(product_id, start=start, end=end, limit=limit)
         predictions = predict_price(product_id)
         
         return jsonify({
@@ -291,12 +437,83 @@ def get_price_data(product_id):
             'last_updated': product['last_updated'],
             'name': product['name'],
             'history': price_history,
-            'predictions': predictions
+            'predictions': predictions,
+            **get_price_sketches().summary(product_id)
         })
     except Exception as e:
         logger.error(f"Error getting price data: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/get_chart_data/<product_id>')
+@login_required
+def get_chart_data(product_id):
+    """Get a downsampled, compactly encoded price series for charting"""
+    try:
+        if product_id not in product_data:
+            return jsonify({'error': 'Product not found'}), 404
+        
+        try:
+            start, end, limit = parse_history_range(request.args)
+            points = int(request.args.get('points', DEFAULT_CHART_POINTS))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid range: {e}'}), 400
+        points = min(max(points, 3), MAX_CHART_POINTS)
+        
+        if start is not None or end is not None or limit is not None:
+            df = get_price_store().read_range(product_id, start=start, end=end, limit=limit)
+        else:
+            df = load_price_frame(product_id)
+        
+        if df is None or df.empty:
+            history = encode_series([], [])
+            history.update({'n': 0, 'total': 0})
+        else:
+            history = chart_series(to_epoch_seconds(df['Timestamp']), df['Price'].values, points)
+        
+        predictions = predict_price(product_id)
+        forecast = encode_series(
+            to_epoch_seconds([point[0] for point in predictions]) if predictions else [],
+            [point[1] for point in predictions]
+        )
+        forecast['lower'] = [round(point[2], 2) for point in predictions]
+        forecast['upper'] = [round(point[3], 2) for point in predictions]
+        return jsonify({
+            'history': history,
+            'predictions': forecast
+        })
+    except Exception as e:
+        logger.error(f"Error getting chart data: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/forecast_batch', methods=['GET', 'POST'])
+@login_required
+def get_forecast_batch():
+    """Get 7-day forecasts for many products from the precomputed forecast table"""
+    try:
+        if request.method == 'POST':
+            product_ids = (request.get_json(silent=True) or {}).get('product_ids')
+        else:
+            ids = request.args.get('ids')
+            product_ids = [pid for pid in ids.split(',') if pid] if ids else None
+        if product_ids is None:
+            product_ids = list(product_data)
+        if not isinstance(product_ids, list):
+            return jsonify({'error': 'product_ids must be a list'}), 400
+        
+        known = [pid for pid in dict.fromkeys(product_ids) if pid in product_data]
+        forecasts = get_forecast_table().lookup_many(known)
+        
+        return jsonify({
+            'forecasts': {
+                pid: [[date.strftime('%Y-%m-%d %H:%M:%S'), *values] for date, *values in points]
+                for pid, points in forecasts.items()
+            },
+            'not_found': [pid for pid in product_ids if pid not in product_data]
+        })
+    except Exception as e:
+        logger.error(f"Error getting batch forecasts: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/get_all_products')
 @login_required
 def get_all_products():
@@ -307,13 +524,23 @@ def get_all_products():
                 'id': product_id,
                 'name': data['name'],
                 'current_price': data['current_price'],
-                'last_updated': data['last_updated']
+                'last_updated': data['last_updated'],
+                **get_price_sketches().summary(product_id)
             })
         return jsonify(products)
     except Exception as e:
         logger.error(f"Error getting all products: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/cache_stats')
+@login_required
+def cache_stats():
+    """Get hit/miss counters of the in-process price cache and the Firebase read cache"""
+    stats = get_price_cache().stats()
+    if firebase_initialized:
+        stats['firebase_reads'] = get_firebase_service().read_cache_stats()
+    return jsonify(stats)
+
 @app.route('/refresh_product/<product_id>', methods=['POST'])
 @login_required
 def refresh_product(product_id):
@@ -344,31 +571,35 @@ def refresh_product(product_id):
         save_data()
         
         # Store comprehensive price update data in Firebase
+        firebase_error = None
         if firebase_initialized:
             firebase_service = get_firebase_service()
             
             # Save price update
-            firebase_service.save_price_update(product_id, {'price': current_price})
-            
-            # Save detailed price history
-            firebase_service.save_price_history(product_id, {
-                'price': current_price,
-                'price_type': 'refresh',
-                'source': 'manual_refresh',
-                'previous_price': product_data[product_id].get('current_price', 0),
-                'price_change': current_price - float(product_data[product_id].get('current_price', 0)),
-                'price_change_percent': ((current_price - float(product_data[product_id].get('current_price', 0))) / float(product_data[product_id].get('current_price', 1))) * 100
-            })
+            if not firebase_service.save_price_update(product_id, {'price': current_price}):
+                firebase_error = 'price update was not saved'
             
-            # Save user activity
-            firebase_service.save_user_activity(current_user.id, 'price_refresh', {
-                'product_id': product_id,
-                'product_name': product_name,
-                'old_price': product_data[product_id].get('current_price', 0),
-                'new_price': current_price,
-                'price_change': current_price - float(product_data[product_id].get('current_price', 0))
-            })
-        return jsonify({'status': 'success', 'product': {
+            with firebase_service.batch() as batch:
+                # Save detailed price history
+                firebase_service.save_price_history(product_id, {
+                    'price': current_price,
+                    'price_type': 'refresh',
+                    'source': 'manual_refresh',
+                    'previous_price': product_data[product_id].get('current_price', 0),
+                    'price_change': current_price - float(product_data[product_id].get('current_price', 0)),
+                    'price_change_percent': ((current_price - float(product_data[product_id].get('current_price', 0))) / float(product_data[product_id].get('current_price', 1))) * 100
+                }, batch=batch)
+                
+                # Save user activity
+                firebase_service.save_user_activity(current_user.id, 'price_refresh', {
+                    'product_id': product_id,
+                    'product_name': product_name,
+                    'old_price': product_data[product_id].get('current_price', 0),
+                    'new_price': current_price,
+                    'price_change': current_price - float(product_data[product_id].get('current_price', 0))
+                }, batch=batch)
+            firebase_error = batch.error or firebase_error
+        product = {
             'id': product_id,
             'name': product_name,
             'current_price': current_price,
@@ -376,7 +607,14 @@ def refresh_product(product_id):
             'max_price': max_price,
             'min_price': min_price,
             'last_updated': product_data[product_id]['last_updated']
-        }})
+        }
+        if firebase_error is not None:
+            return jsonify({
+                'status': 'error',
+                'message': f'Product refreshed locally, but saving it to Firebase failed: {firebase_error}',
+                'product': product
+            }), 502
+        return jsonify({'status': 'success', 'product': product})
     except Exception as e:
         logger.error(f"Error refreshing product: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -419,51 +657,93 @@ def refresh_all_products():
         logger.error(f"Error refreshing all products: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def _ingest_authorized():
+    token = os.environ.get('INGEST_API_TOKEN')
+    auth_header = request.headers.get('Authorization', '')
+    supplied = auth_header[7:] if auth_header.startswith('Bearer ') else request.headers.get('X-Ingest-Token', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+@app.route('/ingest_prices', methods=['POST'])
+def ingest_prices():
+    """Bulk-ingest a partner price feed (NDJSON or CSV) in one batch"""
+    try:
+        if not os.environ.get('INGEST_API_TOKEN'):
+            return jsonify({'status': 'error', 'message': 'Bulk ingest is not configured'}), 503
+        if not _ingest_authorized():
+            return jsonify({'status': 'error', 'message': 'Invalid ingest token'}), 401
+        
+        fmt = request.args.get('format') or feed_format(content_type=request.content_type)
+        try:
+            summary = ingest_stream(request.stream, fmt, product_data)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        save_data()
+        
+        return jsonify({'status': 'success', **summary})
+    except Exception as e:
+        logger.error(f"Error ingesting prices: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @app.route('/realtime_updates')
 @login_required
 def realtime_updates():
-    """Get real-time updates from Firebase"""
+    """Get the most recent price updates, and the event id to stream further ones from"""
     try:
-        if not firebase_initialized:
-            return jsonify({'error': 'Firebase not initialized'}), 500
-        
-        firebase_service = get_firebase_service()
-        updates = []
-        
-        # Get recent price updates (last 10)
-        recent_updates = firebase_service.db.collection('price_history')\
-            .order_by('timestamp', direction=firestore.Query.DESCENDING)\
-            .limit(10)\
-            .stream()
-        
-        for update in recent_updates:
-            data = update.to_dict()
-            updates.append({
-                'product_id': data['product_id'],
-                'price': data['price'],
-                'timestamp': data['timestamp'].isoformat() if hasattr(data['timestamp'], 'isoformat') else str(data['timestamp'])
-            })
-        
-        return jsonify({'updates': updates})
+        event_bus = get_event_bus()
+        last_event_id = event_bus.last_id()
+        events = event_bus.since(event_type='price')[-10:]
+        return jsonify({'updates': [event['data'] for event in reversed(events)], 'last_event_id': last_event_id})
     except Exception as e:
         logger.error(f"Error getting real-time updates: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/price_stream')
+@login_required
+def price_stream():
+    """Stream price updates and alerts as Server-Sent Events.
+    
+    Browsers reconnect with a Last-Event-ID header and get every event
+    they missed that is still buffered; a first connection may pass
+    ?last_event_id= from /realtime_updates.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(
+        stream_with_context(get_event_bus().stream(last_event_id, replay=False)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/sync_to_firebase', methods=['POST'])
 @login_required
 def sync_to_firebase():
-    """Sync all local data to Firebase"""
+    """Sync local products that changed since the last sync to Firebase.
+
+    ?full=true resends all; ?prune=true also deletes remote products that are gone locally.
+    """
     try:
         if not firebase_initialized:
             return jsonify({'error': 'Firebase not initialized'}), 500
         
         firebase_service = get_firebase_service()
-        success = firebase_service.sync_local_data_to_firebase(product_data)
+        full = request.args.get('full', 'false').lower() in ['true', '1']
+        prune = request.args.get('prune', 'false').lower() in ['true', '1']
+        if prune and not product_data:
+            return jsonify({'status': 'error', 'message': 'Refusing to prune: no local products are loaded'}), 400
+        report = firebase_service.sync_local_data_to_firebase(product_data, full=full, prune=prune)
         
-        if success:
-            return jsonify({'status': 'success', 'message': 'Data synced to Firebase successfully'})
-        else:
+        if report is None:
             return jsonify({'status': 'error', 'message': 'Failed to sync data to Firebase'}), 500
+        if report['failed']:
+            return jsonify({
+                'status': 'error',
+                'message': f"{report['failed']} products failed to sync, they will be retried next time",
+                'report': report
+            }), 502
+        return jsonify({
+            'status': 'success',
+            'message': f"Synced {report['synced']} changed products ({report['unchanged']} unchanged)",
+            'report': report
+        })
     except Exception as e:
         logger.error(f"Error syncing to Firebase: {e}")
         return jsonify({'error': str(e)}), 500
@@ -471,16 +751,56 @@ def sync_to_firebase():
 @app.route('/get_user_data')
 @login_required
 def get_user_data():
-    """Get all user-related data from Firebase"""
+    """Get user-related data from Firebase, newest first and a page at a time.
+    
+    ?summary=true returns record counts per category. ?category=activities,
+    negotiations or inputs/<input_type> returns one page of that category,
+    continued with ?cursor=<next_cursor>; without it the first page of every
+    category is returned. ?limit sets the page size.
+    """
     try:
         if not firebase_initialized:
             return jsonify({'error': 'Firebase not initialized'}), 500
         
         firebase_service = get_firebase_service()
-        user_data = firebase_service.get_user_data(current_user.id)
+        if request.args.get('summary', 'false').lower() in ['true', '1']:
+            summary = firebase_service.get_user_data_summary(current_user.id)
+            if summary is None:
+                return jsonify({'status': 'error', 'message': 'Failed to read user data'}), 500
+            return jsonify({'status': 'success', 'summary': summary})
+        
+        try:
+            limit = int(request.args.get('limit', USER_DATA_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'limit must be an integer'}), 400
+        
+        category = request.args.get('category')
+        if category:
+            try:
+                page = firebase_service.get_user_data_page(current_user.id, category, request.args.get('cursor'), limit)
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+            if page is None:
+                return jsonify({'status': 'error', 'message': 'Failed to read user data'}), 500
+            return jsonify({'status': 'success', 'category': category, **page})
+        
+        summary = firebase_service.get_user_data_summary(current_user.id)
+        if summary is None:
+            return jsonify({'status': 'error', 'message': 'Failed to read user data'}), 500
+        categories = ['activities', 'negotiations'] + [f'inputs/{input_type}' for input_type in summary['inputs']]
+        user_data, cursors = {}, {}
+        for category in categories:
+            page = firebase_service.get_user_data_page(current_user.id, category, limit=limit)
+            if page and page['items']:
+                kind, _, input_type = category.partition('/')
+                if input_type:
+                    user_data.setdefault('inputs', {})[input_type] = page['items']
+                else:
+                    user_data[kind] = page['items']
+                cursors[category] = page['next_cursor']
         
         if user_data:
-            return jsonify({'status': 'success', 'data': user_data})
+            return jsonify({'status': 'success', 'data': user_data, 'cursors': cursors})
         else:
             return jsonify({'status': 'error', 'message': 'No user data found'}), 404
     except Exception as e:
@@ -559,9 +879,20 @@ def get_price_trends(product_id):
         logger.error(f"Error getting price trends: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/static/<path:filename>')
-def serve_static(filename):
-    return send_from_directory(app.static_folder, filename)
+@app.route('/chart/<product_id>.png')
+@login_required
+def price_chart(product_id):
+    """Render (or reuse) the price trend chart for a product's current history"""
+    if not CHARTS_ENABLED or product_id not in product_data:
+        abort(404)
+    try:
+        path = get_chart_renderer().render(product_id)
+        if path is None:
+            abort(404)
+        # Point at the content-hashed URL, which browsers may cache indefinitely
+        return redirect(asset_url(os.path.relpath(path, app.static_folder)))
+    except TimeoutError:
+        return jsonify({'error': 'Chart is still rendering, try again shortly'}), 503
 
 if __name__ == '__main__':
     # Register authentication routes
@@ -574,6 +905,18 @@ if __name__ == '__main__':
     # Load saved data
     load_saved_data()
     
+    # Restore derived state from the last snapshot and keep it fresh
+    load_snapshot()
+    start_snapshot_writer(interval_minutes=int(os.environ.get('SNAPSHOT_INTERVAL_MINUTES', 10)))
+    
+    # Persist the summaries of idle negotiations as they expire, and of those still open at shutdown
+    get_negotiation_sessions().start()
+    atexit.register(get_negotiation_sessions().close_all)
+    
+    # Serve stored forecasts and recompute them in the background after new prices land
+    get_forecast_table().load()
+    get_forecast_table().start(lambda: list(product_data), interval_minutes=int(os.environ.get('FORECAST_INTERVAL_MINUTES', 60)))
+    
     # Start automatic refresh every 24 hours
     start_continuous_scraping(product_data, interval_minutes=1440)
     
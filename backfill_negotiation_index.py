@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+One-off backfill of the per-user and per-product negotiation indexes from the global negotiations log
+"""
+
+import sys
+import argparse
+import logging
+from firebase_config import init_firebase, get_firebase_service
+from firebase_writer import MAX_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Each record becomes two index paths, so a page fills one multi-path update
+PAGE_SIZE = MAX_BATCH // 2
+
+def backfill(backend, page_size=PAGE_SIZE, dry_run=False):
+    """Copy every negotiation under negotiations_by_user and negotiations_by_product.
+
+    Reads the log a page at a time in key order and writes each page as one
+    update. Records keep their keys, so running it again rewrites the same
+    paths. Returns counts of copied and skipped (incomplete) records.
+    """
+    counts = {'copied': 0, 'skipped': 0, 'pages': 0}
+    cursor = None
+    while True:
+        # start_at is inclusive, so the previous page's last record is read again and dropped
+        fetch = page_size + (cursor is not None)
+        page = backend.get('negotiations', order_by='$key', start_at=cursor, limit_to_first=fetch) or {}
+        keys = [key for key in sorted(page) if key != cursor]
+        if not keys:
+            return counts
+
+        updates = {}
+        for key in keys:
+            record = page[key]
+            if not isinstance(record, dict) or not record.get('user_id') or not record.get('product_id'):
+                counts['skipped'] += 1
+                continue
+            updates[f"negotiations_by_user/{record['user_id']}/{key}"] = record
+            updates[f"negotiations_by_product/{record['product_id']}/{key}"] = record
+            counts['copied'] += 1
+        if updates and not dry_run:
+            backend.update(updates)
+        counts['pages'] += 1
+        logger.info(f"Backfilled {counts['copied']} negotiations so far")
+
+        if len(keys) < page_size:
+            return counts
+        cursor = keys[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the negotiation indexes in the Realtime Database")
+    parser.add_argument('--config', default='firebase_config.json', help="Firebase service account file")
+    parser.add_argument('--dry-run', action='store_true', help="Count the records without writing")
+    args = parser.parse_args()
+
+    if not init_firebase(args.config):
+        print("❌ Firebase is not configured")
+        return False
+
+    counts = backfill(get_firebase_service().backend, dry_run=args.dry_run)
+    action = "Would copy" if args.dry_run else "Copied"
+    print(f"✅ {action} {counts['copied']} negotiations in {counts['pages']} pages "
+          f"({counts['skipped']} without a user or product)")
+    return True
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Rolling-origin backtests of the forecast models across every product's price history
+"""
+
+import os
+import sys
+import glob
+import time
+import json
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import logging
+from price_cache import load_price_frame
+from price_store import to_epoch_seconds
+from forecasting import FORECASTERS, FORECAST_DAYS, SECONDS_PER_DAY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 30
+
+def rolling_windows(frames, window=DEFAULT_WINDOW, horizon=FORECAST_DAYS, step=1):
+    """Stack every forecast origin of every product into one set of windows.
+
+    An origin is an observation with at least `window - 1` earlier ones and
+    `horizon` days of history after it. Returns (t, y, actual): (m, window)
+    times in days relative to the origin and prices, and the (m, horizon)
+    price actually in effect 1..horizon days after each origin.
+    """
+    t_rows, y_rows, actual_rows = [], [], []
+    steps = np.arange(1, horizon + 1) * SECONDS_PER_DAY
+
+    for df in frames.values():
+        if df is None or len(df) < window:
+            continue
+        df = df.sort_values('Timestamp', kind='stable')
+        epochs = to_epoch_seconds(df['Timestamp']).astype(float)
+        prices = df['Price'].to_numpy(dtype=float)
+
+        origins = np.arange(window - 1, len(epochs), step)
+        origins = origins[epochs[origins] + steps[-1] <= epochs[-1]]
+        if not len(origins):
+            continue
+
+        starts = origins - (window - 1)
+        t_rows.append((sliding_window_view(epochs, window)[starts] - epochs[origins][:, None]) / SECONDS_PER_DAY)
+        y_rows.append(sliding_window_view(prices, window)[starts])
+        targets = epochs[origins][:, None] + steps
+        actual_rows.append(prices[np.searchsorted(epochs, targets, side='right') - 1])
+
+    if not t_rows:
+        return np.empty((0, window)), np.empty((0, window)), np.empty((0, horizon))
+    return np.concatenate(t_rows), np.concatenate(y_rows), np.concatenate(actual_rows)
+
+def evaluate(forecaster, t, y, actual):
+    """Error metrics and fit/predict timings of one model over stacked windows"""
+    steps = np.arange(1, actual.shape[1] + 1, dtype=float)
+
+    started = time.perf_counter()
+    params = forecaster.fit(t, y)
+    fitted = time.perf_counter()
+    predicted = forecaster.predict(params, steps)
+    finished = time.perf_counter()
+
+    errors = predicted - actual
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct = np.abs(errors) / np.abs(actual)
+    return {
+        'model': forecaster.name,
+        'windows': int(len(t)),
+        'mae': float(np.nanmean(np.abs(errors))),
+        'rmse': float(np.sqrt(np.nanmean(errors ** 2))),
+        'mape': float(100 * np.nanmean(pct[np.isfinite(pct)])),
+        'mae_by_horizon': np.nanmean(np.abs(errors), axis=0).round(4).tolist(),
+        'fit_ms': 1000 * (fitted - started),
+        'predict_ms': 1000 * (finished - fitted),
+        'us_per_forecast': 1e6 * (finished - started) / max(len(t), 1)
+    }
+
+def run_backtest(frames, models=None, window=DEFAULT_WINDOW, horizon=FORECAST_DAYS, step=1):
+    """Backtest the named models (all by default), best MAE first"""
+    t, y, actual = rolling_windows(frames, window, horizon, step)
+    if not len(t):
+        return []
+    results = [evaluate(FORECASTERS[name](), t, y, actual) for name in (models or FORECASTERS)]
+    return sorted(results, key=lambda r: r['mae'])
+
+def tracked_product_ids():
+    """Products in product_data.json, or every price history file if there is none"""
+    if os.path.exists('product_data.json'):
+        with open('product_data.json', 'r') as f:
+            return list(json.load(f))
+    return [os.path.basename(path)[len('price_history_'):-len('.csv')] for path in glob.glob('price_history_*.csv')]
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the price forecast models")
+    parser.add_argument('products', nargs='*', help="Product IDs (all tracked products by default)")
+    parser.add_argument('--models', nargs='+', choices=sorted(FORECASTERS), help="Models to compare (all by default)")
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help="Observations each model is fitted on")
+    parser.add_argument('--horizon', type=int, default=FORECAST_DAYS, help="Days ahead to forecast")
+    parser.add_argument('--step', type=int, default=1, help="Observations between forecast origins")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    product_ids = args.products or tracked_product_ids()
+    frames = {pid: load_price_frame(pid) for pid in product_ids}
+    results = run_backtest(frames, args.models, args.window, args.horizon, args.step)
+    if not results:
+        print("❌ Not enough price history to backtest")
+        return False
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return True
+
+    print(f"📊 {results[0]['windows']} forecast origins across {len(product_ids)} products "
+          f"(window {args.window}, horizon {args.horizon} days)")
+    print(f"{'model':<16}{'MAE':>10}{'RMSE':>10}{'MAPE %':>10}{'fit ms':>10}{'pred ms':>10}{'us/fc':>10}")
+    for r in results:
+        print(f"{r['model']:<16}{r['mae']:>10.3f}{r['rmse']:>10.3f}{r['mape']:>10.2f}"
+              f"{r['fit_ms']:>10.1f}{r['predict_ms']:>10.1f}{r['us_per_forecast']:>10.2f}")
+    return True
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Bulk price ingestion for partner feeds (NDJSON or CSV streams of ASIN, timestamp, price)
+
+While the server is running, send feeds to it with --url: local mode writes
+the price files and product_data.json behind the server's back, so the
+server neither notifies its listeners nor sees the new aggregates.
+"""
+
+import os
+import sys
+import argparse
+import requests
+import numpy as np
+import pandas as pd
+from datetime import datetime
+import logging
+from price_store import get_price_store
+from amazon_scraper import analyze_prices, load_product_data, save_product_data
+
+logger = logging.getLogger(__name__)
+
+FEED_FORMATS = ('ndjson', 'csv')
+CHUNK_ROWS = 50000
+MAX_BATCH_ROWS = int(os.environ.get('INGEST_MAX_ROWS', 1000000))
+LOCAL_TZ = datetime.now().astimezone().tzinfo
+
+# Accepted column names for each feed field
+COLUMN_ALIASES = {
+    'asin': ('asin', 'product_id'),
+    'timestamp': ('timestamp', 'time', 'ts'),
+    'price': ('price',)
+}
+
+def feed_format(filename=None, content_type=None):
+    """Guess the feed format from a file name or Content-Type header"""
+    if content_type and 'csv' in content_type:
+        return 'csv'
+    if content_type and ('ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type):
+        return 'ndjson'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return 'ndjson'
+
+def read_feed(stream, fmt='ndjson', chunksize=CHUNK_ROWS):
+    """Yield the feed as DataFrames of at most `chunksize` rows"""
+    if fmt not in FEED_FORMATS:
+        raise ValueError(f"Unsupported feed format: {fmt}")
+    if fmt == 'csv':
+        reader = pd.read_csv(stream, chunksize=chunksize, dtype=str)
+    else:
+        reader = pd.read_json(stream, lines=True, chunksize=chunksize, dtype=False)
+    for chunk in reader:
+        yield chunk
+
+def _normalize_columns(df):
+    columns = {str(c).strip().lower(): c for c in df.columns}
+    renamed = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        source = next((columns[a] for a in aliases if a in columns), None)
+        if source is None:
+            raise ValueError(f"Feed is missing a '{field}' column")
+        renamed[source] = field
+    return df[list(renamed)].rename(columns=renamed)
+
+def _to_local(utc_timestamps):
+    return utc_timestamps.dt.tz_convert(LOCAL_TZ).dt.tz_localize(None)
+
+def _parse_timestamps(values):
+    """Parse ISO 8601 strings or epoch seconds into naive local timestamps (NaT when invalid)"""
+    numeric = pd.to_numeric(values, errors='coerce')
+    text = values.astype(str).str.strip()
+    # Epoch seconds and offset-qualified strings are converted from UTC; naive strings are already local
+    is_epoch = numeric.notna()
+    has_offset = ~is_epoch & text.str.contains(r'(?:Z|[+-]\d{2}:?\d{2})$', regex=True)
+    is_naive = ~is_epoch & ~has_offset
+
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    if is_epoch.any():
+        parsed[is_epoch] = _to_local(pd.to_datetime(numeric[is_epoch], unit='s', utc=True, errors='coerce'))
+    if has_offset.any():
+        parsed[has_offset] = _to_local(pd.to_datetime(text[has_offset], utc=True, errors='coerce', format='ISO8601'))
+    if is_naive.any():
+        parsed[is_naive] = pd.to_datetime(text[is_naive], errors='coerce', format='ISO8601')
+    return parsed.dt.floor('s')
+
+def validate_batch(df):
+    """Validate and normalize a feed chunk.
+
+    Returns (rows, rejected): the valid rows as asin/Timestamp/Price columns
+    and the number of rows that failed validation.
+    """
+    df = _normalize_columns(df)
+    asins = df['asin'].astype(str).str.strip().str.upper()
+    timestamps = _parse_timestamps(df['timestamp'])
+    prices = pd.to_numeric(df['price'], errors='coerce')
+
+    valid = (
+        asins.str.fullmatch(r'[A-Z0-9]{10}')
+        & timestamps.notna()
+        & (timestamps <= pd.Timestamp.now() + pd.Timedelta(days=1))
+        & np.isfinite(prices)
+        & (prices > 0)
+    )
+
+    rows = pd.DataFrame({
+        'asin': asins[valid],
+        'Timestamp': timestamps[valid],
+        'Price': prices[valid].astype(float)
+    })
+    return rows, int((~valid).sum())
+
+def refresh_aggregates(product_data, products):
+    """Update current/avg/max/min price of the tracked products among `products` (asin -> ingest result)"""
+    for product_id, result in products.items():
+        if product_id not in product_data:
+            continue
+        avg_price, max_price, min_price = analyze_prices(product_id)
+        product_data[product_id].update({
+            'current_price': result['latest_price'],
+            'avg_price': avg_price,
+            'max_price': max_price,
+            'min_price': min_price,
+            'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+    return sorted(set(products) - set(product_data))
+
+def ingest_frames(chunks, product_data=None):
+    """Validate, deduplicate and store feed chunks as a single batch.
+
+    All rows are validated before anything is written, then every product's
+    rows are written through one price store transaction. When the product
+    catalogue is given, the aggregates of its products in the batch are
+    refreshed once each (the caller saves it) and the summary lists the
+    untracked ASINs. Returns a summary dict.
+    """
+    valid_chunks = []
+    received, invalid = 0, 0
+    for chunk in chunks:
+        received += len(chunk)
+        if received > MAX_BATCH_ROWS:
+            raise ValueError(f"Batch exceeds {MAX_BATCH_ROWS} rows")
+        rows, rejected = validate_batch(chunk)
+        invalid += rejected
+        valid_chunks.append(rows)
+
+    rows = pd.concat(valid_chunks, ignore_index=True) if valid_chunks else pd.DataFrame(columns=['asin', 'Timestamp', 'Price'])
+    before = len(rows)
+    rows = rows.drop_duplicates(['asin', 'Timestamp'], keep='last').sort_values(['asin', 'Timestamp'], kind='stable')
+    duplicates = before - len(rows)
+
+    batches = {
+        asin: group[['Timestamp', 'Price']].reset_index(drop=True)
+        for asin, group in rows.groupby('asin', sort=False)
+    }
+    written = get_price_store().write_batch(batches)
+
+    products = {}
+    store = get_price_store()
+    for asin, count in written.items():
+        duplicates += len(batches[asin]) - count
+        if not count:
+            continue
+        latest = store.read_range(asin, limit=1)
+        products[asin] = {
+            'rows': count,
+            'latest_timestamp': latest['Timestamp'].iloc[-1].strftime('%Y-%m-%d %H:%M:%S'),
+            'latest_price': float(latest['Price'].iloc[-1])
+        }
+
+    summary = {
+        'received': received,
+        'accepted': sum(p['rows'] for p in products.values()),
+        'invalid': invalid,
+        'duplicates': duplicates,
+        'products': products
+    }
+    if product_data is not None:
+        summary['untracked'] = refresh_aggregates(product_data, products)
+    logger.info(f"Bulk ingest: {summary['accepted']} rows for {len(products)} products "
+                f"({invalid} invalid, {duplicates} duplicates)")
+    return summary
+
+def ingest_stream(stream, fmt='ndjson', product_data=None):
+    """Ingest a whole NDJSON/CSV feed stream as one batch"""
+    return ingest_frames(read_feed(stream, fmt), product_data)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest a partner price feed into the local price store",
+        epilog="Use --url while the server is running; local mode is for when it is stopped."
+    )
+    parser.add_argument('feed', help="NDJSON or CSV file with asin, timestamp and price columns ('-' for stdin)")
+    parser.add_argument('--format', choices=FEED_FORMATS, help="Feed format (guessed from the file name by default)")
+    parser.add_argument('--url', help="Send the feed to a running server's /ingest_prices endpoint instead")
+    args = parser.parse_args()
+
+    fmt = args.format or feed_format(filename=args.feed)
+    stream = sys.stdin.buffer if args.feed == '-' else open(args.feed, 'rb')
+
+    try:
+        if args.url:
+            token = os.environ.get('INGEST_API_TOKEN', '')
+            content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+            response = requests.post(args.url, data=stream, headers={
+                'Authorization': f'Bearer {token}',
+                'Content-Type': content_type
+            })
+            print(response.status_code, response.text)
+            return response.ok
+
+        product_data = load_product_data()
+        summary = ingest_stream(stream, fmt, product_data)
+        if summary['accepted']:
+            save_product_data(product_data)
+        print(f"✅ Ingested {summary['accepted']} rows for {len(summary['products'])} products "
+              f"({summary['invalid']} invalid, {summary['duplicates']} duplicates)")
+        return True
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,68 @@
+"""
+Compact, downsampled price series for dashboard charts
+"""
+
+import numpy as np
+
+DEFAULT_CHART_POINTS = 500
+MAX_CHART_POINTS = 5000
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of at most `threshold` points that keep the visual
+    shape of the series: the first and last points, plus one point per
+    bucket forming the largest triangle with the previously selected point
+    and the average of the next bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket i spans [edges[i], edges[i + 1]) over the interior points
+    every = (n - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    # Average of each bucket, computed in one pass; the last "next bucket" is the final point
+    x_avg = np.add.reduceat(x[:n - 1], edges[:-1]) / np.diff(edges)
+    y_avg = np.add.reduceat(y[:n - 1], edges[:-1]) / np.diff(edges)
+    next_x = np.append(x_avg[1:], x[-1])
+    next_y = np.append(y_avg[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        areas = np.abs(
+            (x[a] - next_x[i]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y[i] - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+def encode_series(epochs, prices):
+    """Compact columnar encoding: first timestamp plus second deltas, prices rounded to cents"""
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if not len(epochs):
+        return {'t0': None, 'dt': [], 'p': []}
+    return {
+        't0': int(epochs[0]),
+        'dt': np.diff(epochs).tolist(),
+        'p': np.round(np.asarray(prices, dtype=float), 2).tolist()
+    }
+
+def chart_series(epochs, prices, points=DEFAULT_CHART_POINTS):
+    """Downsample a series to `points` with LTTB and encode it"""
+    epochs = np.asarray(epochs, dtype=np.int64)
+    prices = np.asarray(prices, dtype=float)
+    keep = lttb(epochs, prices, points)
+    series = encode_series(epochs[keep], prices[keep])
+    series['n'] = int(len(keep))
+    series['total'] = int(len(epochs))
+    return series
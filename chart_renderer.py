@@ -0,0 +1,128 @@
+"""
+On-demand price trend chart rendering (opt-in, off the scrape and request paths)
+"""
+
+import os
+import glob
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+import logging
+from price_cache import history_version, load_price_frame
+
+logger = logging.getLogger(__name__)
+
+CHARTS_ENABLED = os.environ.get('ENABLE_CHART_RENDERING', 'false').lower() in ['true', 'on', '1']
+CHART_DIR = os.path.join('static', 'charts')
+
+def chart_path(product_id, version):
+    """File a chart of the given history version is rendered to"""
+    mtime_ns, size = version
+    return os.path.join(CHART_DIR, f"price_trend_{product_id}_{mtime_ns:x}_{size:x}.png")
+
+def _chart_mtime(product_id, path):
+    # History mtime a chart file was rendered from; None for in-progress or unrecognised files
+    name = os.path.basename(path)
+    prefix = f"price_trend_{product_id}_"
+    if not name.startswith(prefix) or name.endswith('.tmp.png'):
+        return None
+    try:
+        mtime, _ = name[len(prefix):-len('.png')].split('_')
+        return int(mtime, 16)
+    except ValueError:
+        return None
+
+def _style_axes(ax, style):
+    # Seaborn's style applied to one axes, leaving the global rcParams alone (renders run in parallel)
+    ax.set_facecolor(style['axes.facecolor'])
+    ax.set_axisbelow(style['axes.axisbelow'])
+    ax.grid(True, color=style['grid.color'], linestyle=style['grid.linestyle'])
+    for spine in ax.spines.values():
+        spine.set_edgecolor(style['axes.edgecolor'])
+    ax.tick_params(colors=style['xtick.color'])
+
+def _render_chart(product_id, version, path):
+    # Plotting libraries are only loaded once a chart is actually requested.
+    # Figures are built without pyplot so renders can run in parallel workers.
+    from matplotlib.figure import Figure
+    import seaborn as sns
+
+    df = load_price_frame(product_id)
+    os.makedirs(CHART_DIR, exist_ok=True)
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    _style_axes(ax, sns.axes_style("darkgrid"))
+    sns.lineplot(data=df, x='Timestamp', y='Price', marker='o', ax=ax)
+    ax.set_title(f"Price Trend for {product_id}")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Price")
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    tmp_path = f"{path}.tmp.png"
+    fig.savefig(tmp_path)
+    os.replace(tmp_path, path)
+
+    # Charts of older history versions are never served again; newer ones and renders still
+    # in progress are left alone
+    for old_path in glob.glob(os.path.join(CHART_DIR, f"price_trend_{product_id}_*.png")):
+        old_mtime = _chart_mtime(product_id, old_path)
+        if old_path.endswith('.tmp.png') or (old_mtime is not None and old_mtime >= version[0]):
+            continue
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+    logger.info(f"Rendered price chart for {product_id}")
+    return path
+
+class ChartRenderer:
+    """Renders charts lazily in a bounded worker pool, once per history version"""
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chart-render')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _render(self, product_id, version, path):
+        if os.path.exists(path):
+            return path
+        return _render_chart(product_id, version, path)
+
+    def submit(self, product_id):
+        """Future resolving to the chart file for the product's current history, or None if there is no history"""
+        version = history_version(product_id)
+        if version is None:
+            return None
+
+        path = chart_path(product_id, version)
+        with self._lock:
+            future = self._pending.get((product_id, version))
+            if future is None:
+                if os.path.exists(path):
+                    return _done(path)
+                future = self._executor.submit(self._render, product_id, version, path)
+                self._pending[(product_id, version)] = future
+                future.add_done_callback(lambda f, key=(product_id, version): self._forget(key))
+            return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def render(self, product_id, timeout=30):
+        """Chart file for a product, rendering it if needed"""
+        future = self.submit(product_id)
+        return future.result(timeout=timeout) if future is not None else None
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+# Global chart renderer instance
+chart_renderer = ChartRenderer(max_workers=int(os.environ.get('CHART_RENDER_WORKERS', 2)))
+
+def get_chart_renderer():
+    """Get chart renderer instance"""
+    return chart_renderer
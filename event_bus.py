@@ -0,0 +1,103 @@
+"""
+In-process event bus for pushing price changes and alerts to browsers as Server-Sent Events
+"""
+
+import os
+import json
+import uuid
+import threading
+from collections import deque
+import pandas as pd
+import logging
+from price_store import get_price_store
+from price_alerts import get_price_alerts
+
+logger = logging.getLogger(__name__)
+
+# Events kept for clients that reconnect with Last-Event-ID
+EVENT_BUFFER_SIZE = int(os.environ.get('EVENT_BUFFER_SIZE', 1000))
+# Idle streams send a comment this often so proxies keep the connection open
+EVENT_KEEPALIVE_SECONDS = 15
+
+class EventBus:
+    """Ring buffer of published events with blocking reads for stream handlers.
+
+    Event ids are '<boot>-<sequence>': the boot token changes on every
+    restart, so a client resuming with an id from an earlier process is
+    sent everything still buffered instead of nothing.
+    """
+
+    def __init__(self, size=EVENT_BUFFER_SIZE):
+        self.boot = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=size)
+        self._seq = 0
+        self._changed = threading.Condition()
+
+    def publish(self, event_type, data):
+        """Add an event and wake every waiting stream; returns its id"""
+        with self._changed:
+            self._seq += 1
+            event = {'id': f"{self.boot}-{self._seq}", 'seq': self._seq, 'type': event_type, 'data': data}
+            self._events.append(event)
+            self._changed.notify_all()
+        return event['id']
+
+    def last_id(self):
+        """Id of the newest event, for a client to resume from"""
+        with self._changed:
+            return f"{self.boot}-{self._seq}"
+
+    def _seq_of(self, last_event_id):
+        boot, _, seq = (last_event_id or '').partition('-')
+        if boot != self.boot or not seq.isdigit():
+            return 0
+        return int(seq)
+
+    def since(self, last_event_id=None, event_type=None):
+        """Buffered events after `last_event_id`, oldest first"""
+        seq = self._seq_of(last_event_id)
+        with self._changed:
+            return [
+                event for event in self._events
+                if event['seq'] > seq and (event_type is None or event['type'] == event_type)
+            ]
+
+    def wait(self, last_event_id, timeout):
+        """Events after `last_event_id`, blocking up to `timeout` seconds for the first one"""
+        seq = self._seq_of(last_event_id)
+        with self._changed:
+            self._changed.wait_for(lambda: self._seq > seq, timeout=timeout)
+            return [event for event in self._events if event['seq'] > seq]
+
+    def stream(self, last_event_id=None, replay=True):
+        """Server-Sent Events text for a client: missed events, then new ones as they arrive"""
+        if not replay and not last_event_id:
+            last_event_id = self.last_id()
+        yield "retry: 3000\n\n"
+        while True:
+            events = self.wait(last_event_id, EVENT_KEEPALIVE_SECONDS)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+            last_event_id = events[-1]['id']
+
+def _publish_prices(product_id, rows, version):
+    # One event per write, carrying its newest row
+    latest = rows.loc[rows['Timestamp'].idxmax()]
+    event_bus.publish('price', {
+        'product_id': product_id,
+        'price': float(latest['Price']),
+        'timestamp': pd.Timestamp(latest['Timestamp']).strftime('%Y-%m-%d %H:%M:%S'),
+        'rows': len(rows)
+    })
+
+# Global event bus instance
+event_bus = EventBus()
+get_price_store().add_listener(_publish_prices)
+get_price_alerts().subscribe(lambda event: event_bus.publish('alert', event))
+
+def get_event_bus():
+    """Get event bus instance"""
+    return event_bus
@@ -0,0 +1,263 @@
+"""
+Realtime Database backends: the live Firebase database, or an in-memory stand-in for offline tests and load tests
+"""
+
+import os
+import copy
+import json
+import time
+import random
+import threading
+from abc import ABC, abstractmethod
+
+class BackendUnavailable(ConnectionError):
+    """Raised by the in-memory backend for an injected failure"""
+
+def _split(path):
+    return [part for part in (path or '').split('/') if part]
+
+def _key_order(key):
+    # Integer-like keys sort numerically before all other keys
+    try:
+        number = int(key)
+        if str(number) == key and -2**31 <= number < 2**31:
+            return (0, number, '')
+    except ValueError:
+        pass
+    return (1, 0, key)
+
+def _value_order(value):
+    # null < false < true < numbers < strings < objects
+    if value is None:
+        return (0, 0, '')
+    if value is False:
+        return (1, 0, '')
+    if value is True:
+        return (2, 0, '')
+    if isinstance(value, (int, float)):
+        return (3, value, '')
+    if isinstance(value, str):
+        return (4, 0, value)
+    return (5, 0, '')
+
+def _child_value(value, child_path):
+    for part in _split(child_path):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def _prune(value):
+    # The database stores no nulls or empty objects
+    if isinstance(value, dict):
+        pruned = {str(k): _prune(v) for k, v in value.items()}
+        pruned = {k: v for k, v in pruned.items() if v is not None}
+        return pruned or None
+    return value
+
+class RealtimeBackend(ABC):
+    """What FirebaseService needs from a Realtime Database.
+
+    `update({path: value})` writes all paths atomically (a None value
+    deletes). `get(path, ...)` reads a path; with `order_by` ('$key',
+    '$value' or a child path) the children can be filtered with
+    equal_to/start_at/end_at and limited with limit_to_first/limit_to_last.
+    `shallow=True` returns only the child keys. `listen(path, callback)`
+    calls `callback(path, value)` for changes at or below `path`.
+    """
+
+    @abstractmethod
+    def update(self, updates):
+        """Write {path: value} atomically"""
+
+    @abstractmethod
+    def get(self, path, order_by=None, equal_to=None, start_at=None, end_at=None,
+            limit_to_first=None, limit_to_last=None, shallow=False):
+        """Value at `path`, optionally ordered, filtered and limited"""
+
+    @abstractmethod
+    def listen(self, path, callback):
+        """Call `callback(path, value)` for changes at or below `path`"""
+
+class FirebaseRealtimeBackend(RealtimeBackend):
+    """The live database through firebase_admin"""
+
+    def __init__(self, root=None):
+        from firebase_admin import db as firebase_db
+        self.root = root or firebase_db.reference()
+
+    def update(self, updates):
+        self.root.update(updates)
+
+    def get(self, path, order_by=None, equal_to=None, start_at=None, end_at=None,
+            limit_to_first=None, limit_to_last=None, shallow=False):
+        ref = self.root.child(path) if path else self.root
+        filtered = any(v is not None for v in (equal_to, start_at, end_at, limit_to_first, limit_to_last))
+        if order_by is None and not filtered:
+            return ref.get(shallow=shallow)
+
+        if order_by in (None, '$key'):
+            query = ref.order_by_key()
+        elif order_by == '$value':
+            query = ref.order_by_value()
+        else:
+            query = ref.order_by_child(order_by)
+        if equal_to is not None:
+            query = query.equal_to(equal_to)
+        if start_at is not None:
+            query = query.start_at(start_at)
+        if end_at is not None:
+            query = query.end_at(end_at)
+        if limit_to_first is not None:
+            query = query.limit_to_first(limit_to_first)
+        if limit_to_last is not None:
+            query = query.limit_to_last(limit_to_last)
+        return query.get()
+
+    def listen(self, path, callback):
+        # The first event carries the whole tree at `path`
+        def on_event(event):
+            callback('/'.join(_split(path) + _split(event.path)), event.data)
+        return self.root.child(path).listen(on_event)
+
+class InMemoryRealtimeBackend(RealtimeBackend):
+    """A Realtime Database held in a dict, with the same path and query semantics.
+
+    `latency` (seconds, or a (min, max) range) is slept on every call and
+    `failure_rate` is the chance a call raises BackendUnavailable, so routes
+    can be load-tested against slow or flaky storage. `fail_next(n)` makes
+    the next n calls fail.
+    """
+
+    def __init__(self, latency=0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.stats = {'reads': 0, 'writes': 0, 'failures': 0}
+        self._data = {}
+        self._listeners = []
+        self._forced_failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Configured by FIREBASE_MEMORY_LATENCY_MS ('20' or a range like '10-50') and FIREBASE_MEMORY_FAILURE_RATE"""
+        latency = os.environ.get('FIREBASE_MEMORY_LATENCY_MS', '0')
+        if '-' in latency:
+            low, high = latency.split('-', 1)
+            latency = (float(low) / 1000, float(high) / 1000)
+        else:
+            latency = float(latency) / 1000
+        return cls(latency=latency, failure_rate=float(os.environ.get('FIREBASE_MEMORY_FAILURE_RATE', 0)))
+
+    def fail_next(self, count=1):
+        self._forced_failures += count
+
+    def _delay(self):
+        # Simulated network time, spent outside the lock so concurrent calls overlap like real ones
+        if self.latency:
+            low, high = self.latency if isinstance(self.latency, (tuple, list)) else (self.latency, self.latency)
+            time.sleep(self._rng.uniform(low, high))
+
+    def _call(self, kind):
+        if self._forced_failures > 0 or (self.failure_rate and self._rng.random() < self.failure_rate):
+            self._forced_failures = max(0, self._forced_failures - 1)
+            self.stats['failures'] += 1
+            raise BackendUnavailable(f"Injected {kind} failure")
+        self.stats[kind] += 1
+
+    def update(self, updates):
+        paths = [_split(path) for path in updates]
+        # Each path and all its ancestors in sets, so every check is O(depth)
+        seen, ancestors = set(), set()
+        for parts in paths:
+            key = tuple(parts)
+            if key in seen or key in ancestors or any(key[:i] in seen for i in range(len(key))):
+                raise ValueError(f"Overlapping paths in one update: /{'/'.join(parts)}")
+            seen.add(key)
+            ancestors.update(key[:i] for i in range(len(key)))
+
+        # Round-trip through JSON so stored values are detached and JSON-shaped, like the real database
+        # (which also rejects NaN and infinities)
+        values = [_prune(json.loads(json.dumps(value, allow_nan=False))) for value in updates.values()]
+        self._delay()
+        with self._lock:
+            self._call('writes')
+            for parts, value in zip(paths, values):
+                self._set(parts, value)
+            listeners = list(self._listeners)
+
+        for prefix, callback in listeners:
+            for parts, value in zip(paths, values):
+                if parts[:len(prefix)] == prefix or prefix[:len(parts)] == parts:
+                    callback('/'.join(parts), value)
+
+    def listen(self, path, callback):
+        with self._lock:
+            self._listeners.append((_split(path), callback))
+
+    def _set(self, parts, value):
+        if not parts:
+            self._data = value if isinstance(value, dict) else {}
+            return
+        node = self._data
+        trail = []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            trail.append((node, part))
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+            # Deleting the last child removes the now-empty parents as well
+            for parent, part in reversed(trail):
+                if parent[part]:
+                    break
+                del parent[part]
+        else:
+            node[parts[-1]] = value
+
+    def get(self, path, order_by=None, equal_to=None, start_at=None, end_at=None,
+            limit_to_first=None, limit_to_last=None, shallow=False):
+        self._delay()
+        with self._lock:
+            self._call('reads')
+            value = self._data
+            for part in _split(path):
+                value = value.get(part) if isinstance(value, dict) else None
+                if value is None:
+                    break
+            value = copy.deepcopy(value) if value != {} else None
+
+        if not isinstance(value, dict):
+            return value
+        if shallow:
+            return {k: (True if isinstance(v, dict) else v) for k, v in value.items()}
+
+        filtered = any(v is not None for v in (equal_to, start_at, end_at, limit_to_first, limit_to_last))
+        if order_by is None and not filtered:
+            return value
+
+        if order_by in (None, '$key'):
+            sort_key = lambda item: _key_order(item[0])
+            bound = lambda v: _key_order(str(v))
+        else:
+            extract = (lambda v: v) if order_by == '$value' else (lambda v: _child_value(v, order_by))
+            sort_key = lambda item: (_value_order(extract(item[1])), _key_order(item[0]))
+            bound = lambda v: (_value_order(v),)
+
+        items = sorted(value.items(), key=sort_key)
+        if equal_to is not None:
+            start_at = end_at = equal_to
+        if start_at is not None:
+            items = [item for item in items if sort_key(item)[:len(bound(start_at))] >= bound(start_at)]
+        if end_at is not None:
+            items = [item for item in items if sort_key(item)[:len(bound(end_at))] <= bound(end_at)]
+        if limit_to_first is not None:
+            items = items[:limit_to_first]
+        if limit_to_last is not None:
+            items = items[-limit_to_last:] if limit_to_last else []
+        return dict(items)
@@ -0,0 +1,128 @@
+"""
+Read-through TTL cache for Realtime Database reads, invalidated by the writes that change them
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+FIREBASE_CACHE_TTL_SECONDS = float(os.environ.get('FIREBASE_CACHE_TTL_SECONDS', 60))
+FIREBASE_CACHE_SIZE = int(os.environ.get('FIREBASE_CACHE_SIZE', 1024))
+# Reads kept per owner (e.g. pages of one user's data); the least recently stored go first
+FIREBASE_CACHE_KEYS_PER_OWNER = int(os.environ.get('FIREBASE_CACHE_KEYS_PER_OWNER', 32))
+# Also invalidate on changes made by other processes, through Realtime Database listeners
+FIREBASE_CACHE_LISTEN = os.environ.get('FIREBASE_CACHE_LISTEN', 'false').lower() in ['true', 'on', '1']
+
+# Trees whose contents are cached; writes anywhere else never invalidate
+CACHED_ROOTS = ['user_inputs', 'user_activities', 'negotiations_by_user',
+                'price_history', 'product_metadata', 'negotiations_by_product']
+
+def owners_of_write(path):
+    """Cache owners whose reads may see a write at `path`; None means all of them"""
+    parts = [part for part in path.split('/') if part]
+    if not parts or parts[0] not in CACHED_ROOTS:
+        return set()
+    if len(parts) == 1:
+        return None
+    root, key = parts[0], parts[1]
+    if root in ('user_inputs', 'user_activities', 'negotiations_by_user'):
+        return {('user', key)}
+    return {('product', key)}
+
+class FirebaseReadCache:
+    """TTL and size-bounded LRU cache of Realtime Database reads.
+
+    Entries are grouped by owner, ('user', user_id) or ('product',
+    product_id), and each owner may hold up to `max_keys` keyed reads;
+    expired ones are dropped before the oldest live one. A write
+    drops every owner it can affect, so callers read their own writes;
+    the TTL bounds how stale a read can be after a change made elsewhere.
+    """
+
+    def __init__(self, ttl_seconds=FIREBASE_CACHE_TTL_SECONDS, max_entries=FIREBASE_CACHE_SIZE,
+                 max_keys=FIREBASE_CACHE_KEYS_PER_OWNER):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.max_keys = max_keys
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, owner, key, compute):
+        """Cached result of `compute()` (shared, do not mutate); None results are not cached"""
+        now = time.monotonic()
+        with self._lock:
+            values = self._entries.get(owner)
+            if values is not None and key in values and values[key][0] > now:
+                self._entries.move_to_end(owner)
+                self.hits += 1
+                return values[key][1]
+            self.misses += 1
+            generation = self.invalidations
+
+        value = compute()
+        if value is None or self.ttl <= 0:
+            return value
+        with self._lock:
+            # A write that landed while we were reading may not be in `value`
+            if self.invalidations == generation:
+                values = self._entries.setdefault(owner, {})
+                values.pop(key, None)
+                if len(values) >= self.max_keys:
+                    for expired in [k for k, (expires, _) in values.items() if expires <= now]:
+                        del values[expired]
+                    while len(values) >= self.max_keys:
+                        del values[next(iter(values))]
+                values[key] = (now + self.ttl, value)
+                self._entries.move_to_end(owner)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate_writes(self, updates):
+        """Drop everything a multi-path update {path: value} may have changed"""
+        owners = set()
+        for path in updates:
+            affected = owners_of_write(path)
+            if affected is None:
+                self.clear()
+                return
+            owners |= affected
+        if owners:
+            with self._lock:
+                for owner in owners:
+                    self._entries.pop(owner, None)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def listen(self, backend):
+        """Invalidate on changes from any client via backend listeners"""
+        for root in CACHED_ROOTS:
+            try:
+                backend.listen(root, lambda path, value: self.invalidate_writes({path: value}))
+            except Exception as e:
+                logger.error(f"Could not listen on {root} for cache invalidation: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'max_keys_per_owner': self.max_keys,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations
+            }
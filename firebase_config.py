@@ -4,29 +4,144 @@ Firebase configuration and initialization for DealMaker AI
 
 import os
 import json
+import time
+import random
+import threading
 import firebase_admin
-from firebase_admin import credentials, firestore, db
+from firebase_admin import credentials, firestore
 from datetime import datetime
 import logging
+from contextlib import contextmanager
+from firebase_writer import WriteBehindQueue, PathSet
+from firebase_backend import FirebaseRealtimeBackend, InMemoryRealtimeBackend
+from firebase_cache import FirebaseReadCache, FIREBASE_CACHE_LISTEN
+from firebase_sync import ProductSync
+from firebase_outbox import FirebaseOutbox
 
 logger = logging.getLogger(__name__)
 
+# Queue Realtime Database writes and send them from a background thread
+WRITE_BEHIND = os.environ.get('FIREBASE_WRITE_BEHIND', 'true').lower() in ['true', 'on', '1']
+# Store every Realtime Database write in a local durable outbox first (takes precedence over WRITE_BEHIND)
+OUTBOX = os.environ.get('FIREBASE_OUTBOX', 'true').lower() in ['true', 'on', '1']
+# Realtime Database backend: 'firebase', or 'memory' for local and load testing
+BACKEND = os.environ.get('FIREBASE_BACKEND', 'firebase').lower()
+
+# Records per page of user data, and the most a caller may ask for
+USER_DATA_PAGE_SIZE = 50
+MAX_USER_DATA_PAGE_SIZE = 500
+
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+class PushIdGenerator:
+    """Client-side Realtime Database push keys: chronologically ordered and unique,
+    so many child records can be written in a single multi-path update"""
+
+    def __init__(self):
+        self._last_time = 0
+        self._last_random = [0] * 12
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            now = int(time.time() * 1000)
+            if now == self._last_time:
+                # Same millisecond: increment the random suffix so keys stay ordered
+                for i in range(11, -1, -1):
+                    if self._last_random[i] != 63:
+                        self._last_random[i] += 1
+                        break
+                    self._last_random[i] = 0
+            else:
+                self._last_time = now
+                self._last_random = [random.randrange(64) for _ in range(12)]
+            random_chars = ''.join(PUSH_CHARS[i] for i in self._last_random)
+
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        return ''.join(reversed(time_chars)) + random_chars
+
+generate_push_id = PushIdGenerator()
+
+class WriteBatch:
+    """Unit of work: Realtime Database writes collected across paths and committed as one
+    atomic multi-path update, with push keys generated client-side"""
+
+    def __init__(self, service):
+        self._service = service
+        self.updates = {}
+        self._paths = PathSet()
+        self.error = None
+
+    def set(self, path, value):
+        """Stage a write of `value` at `path`"""
+        if self._paths.overlaps(path):
+            raise ValueError(f"{path} overlaps a path already in this batch")
+        self._paths.add(path)
+        self.updates[path] = value
+        return path
+
+    def push(self, parent, value):
+        """Stage a new child of `parent`; returns its key"""
+        key = generate_push_id()
+        self.set(f"{parent}/{key}", value)
+        return key
+
+    def commit(self):
+        if not self.updates:
+            return True
+        updates, self.updates, self._paths = self.updates, {}, PathSet()
+        return self._service._write(updates)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Nothing is written if the block failed part-way; a failed commit is logged and kept in
+        # `error` for the caller to report, not raised
+        if exc_type is None:
+            try:
+                self.commit()
+            except Exception as e:
+                self.error = e
+                logger.error(f"Failed to commit Firebase batch: {e}")
+        return False
+
+def stage_negotiation(batch, record):
+    """Stage a negotiation record under one key in the global log and the per-user and per-product indexes"""
+    key = batch.push('negotiations', record)
+    batch.set(f"negotiations_by_user/{record['user_id']}/{key}", record)
+    batch.set(f"negotiations_by_product/{record['product_id']}/{key}", record)
+    return key
+
 class FirebaseService:
     """Firebase service for real-time data operations"""
     
     def __init__(self):
         self.db = None
-        self.db_realtime = None
+        self.backend = None
+        self.writer = None
+        self.outbox = None
+        self.cache = FirebaseReadCache()
+        self.product_sync = ProductSync(self._commit_products)
         self.initialized = False
         
     def initialize(self, config_path=None):
         """Initialize Firebase with configuration"""
         try:
+            if BACKEND == 'memory':
+                # No credentials needed and nothing leaves the process
+                self.use_backend(InMemoryRealtimeBackend.from_env())
+                logger.info("Using the in-memory Realtime Database backend")
+                return True
+            
             # Check if Firebase is already initialized
             if firebase_admin._apps:
                 logger.info("Firebase already initialized")
-                self.db_realtime = firebase_db.reference()
-                self.initialized = True
+                self.db = firestore.client()
+                self.use_backend(FirebaseRealtimeBackend())
                 return True
             
             # Try to get config from environment variables first
@@ -43,10 +158,13 @@ class FirebaseService:
             else:
                 # Initialize with provided credentials
                 cred = credentials.Certificate(firebase_config)
-                firebase_admin.initialize_app(cred)
+                firebase_admin.initialize_app(cred, {
+                    'databaseURL': os.getenv('FIREBASE_DATABASE_URL') or firebase_config.get(
+                        'databaseURL', f"https://{firebase_config['project_id']}-default-rtdb.firebaseio.com/")
+                })
             
-            self.db_realtime = firebase_db.reference()
-            self.initialized = True
+            self.db = firestore.client()
+            self.use_backend(FirebaseRealtimeBackend())
             logger.info("Firebase initialized successfully")
             return True
             
@@ -54,6 +172,66 @@ class FirebaseService:
             logger.error(f"Failed to initialize Firebase: {e}")
             return False
     
+    def use_backend(self, backend):
+        """Serve Realtime Database reads and writes from `backend`"""
+        self.backend = backend
+        self.cache.clear()
+        if FIREBASE_CACHE_LISTEN:
+            self.cache.listen(backend)
+        self._start_writer()
+        self.initialized = True
+    
+    def _start_writer(self):
+        if OUTBOX:
+            if self.outbox is None:
+                self.outbox = FirebaseOutbox(self._apply, read=lambda path, **query: self.backend.get(path, **query)).start()
+        elif WRITE_BEHIND and self.writer is None:
+            self.writer = WriteBehindQueue(self._apply).start()
+    
+    def _apply(self, updates):
+        self.backend.update(updates)
+        self.cache.invalidate_writes(updates)
+    
+    def _write(self, updates):
+        """Write {path: value} to the Realtime Database, through the outbox or write-behind queue when enabled"""
+        if self.outbox is not None or self.writer is not None:
+            # Dropped now so reads cached before this write stop being served. Until the write is
+            # delivered, a read still returns (and may cache) the old data; _apply drops that again
+            # once the write lands, so it is stale for at most the delivery delay.
+            self.cache.invalidate_writes(updates)
+            if self.outbox is not None:
+                self.outbox.append(updates)
+                return True
+            return self.writer.enqueue(updates)
+        self._apply(updates)
+        return True
+    
+    def batch(self):
+        """Start a unit of work; use as `with service.batch() as batch:` to commit on exit"""
+        return WriteBatch(self)
+    
+    @contextmanager
+    def _staged(self, batch):
+        # Add to the caller's unit of work, or commit a single-write one of our own
+        if batch is not None:
+            yield batch
+        else:
+            # Committed explicitly so a failed write reaches the caller's error handling
+            own = self.batch()
+            yield own
+            own.commit()
+    
+    def write_queue_stats(self):
+        """Counters of the outbox or write-behind queue"""
+        queue = self.outbox or self.writer
+        if queue is None:
+            return None
+        return {**queue.stats, 'pending': queue.pending()}
+    
+    def read_cache_stats(self):
+        """Counters of the read cache"""
+        return self.cache.stats()
+    
     def _get_config_from_env(self):
         """Get Firebase configuration from environment variables"""
         config = {}
@@ -82,7 +260,7 @@ class FirebaseService:
         
         return config if config else None
     
-    def save_product_data(self, product_id, product_data):
+    def save_product_data(self, product_id, product_data, batch=None):
         """Save product data to Firebase Real-time Database"""
         if not self.initialized:
             logger.error("Firebase not initialized")
@@ -90,12 +268,12 @@ class FirebaseService:
         
         try:
             # Save to Real-time Database
-            product_ref = self.db_realtime.child('products').child(product_id)
-            product_ref.set({
-                **product_data,
-                'last_updated': datetime.utcnow().isoformat(),
-                'firebase_sync': True
-            })
+            with self._staged(batch) as staged:
+                staged.set(f'products/{product_id}', {
+                    **product_data,
+                    'last_updated': datetime.utcnow().isoformat(),
+                    'firebase_sync': True
+                })
             logger.info(f"Product {product_id} saved to Firebase Real-time Database")
             return True
         except Exception as e:
@@ -176,123 +354,156 @@ class FirebaseService:
             logger.error(f"Failed to get price history for {product_id}: {e}")
             return []
     
-    def sync_local_data_to_firebase(self, local_product_data):
-        """Sync local product data to Firebase"""
-        if not self.initialized:
-            logger.error("Firebase not initialized")
-            return False
+    def sync_local_data_to_firebase(self, local_product_data, full=False, prune=False):
+        """Sync products that changed since the last sync to Firestore; returns the sync report"""
+        if not self.initialized or self.db is None:
+            logger.error("Firestore not initialized")
+            return None
         
         try:
-            batch = self.db.batch()
-            synced_count = 0
-            
-            for product_id, data in local_product_data.items():
-                doc_ref = self.db.collection('products').document(product_id)
+            return self.product_sync.sync(local_product_data, full=full, prune=prune)
+        except Exception as e:
+            logger.error(f"Failed to sync data to Firebase: {e}")
+            return None
+    
+    def _commit_products(self, chunk):
+        # One Firestore batch per chunk of (product_id, record or None to delete)
+        batch = self.db.batch()
+        for product_id, data in chunk:
+            doc_ref = self.db.collection('products').document(product_id)
+            if data is None:
+                batch.delete(doc_ref)
+            else:
                 batch.set(doc_ref, {
                     **data,
                     'last_updated': datetime.utcnow(),
                     'firebase_sync': True
                 })
-                synced_count += 1
-            
-            batch.commit()
-            logger.info(f"Synced {synced_count} products to Firebase")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to sync data to Firebase: {e}")
-            return False
+        batch.commit()
     
-    def save_user_input(self, user_id, input_type, input_data):
+    def save_user_input(self, user_id, input_type, input_data, batch=None):
         """Save user input data (URLs, offers, negotiations) to Firebase"""
         if not self.initialized:
             logger.error("Firebase not initialized")
             return False
         
         try:
-            input_ref = self.db_realtime.child('user_inputs').child(str(user_id)).child(input_type).push()
-            input_ref.set({
-                **input_data,
-                'timestamp': datetime.utcnow().isoformat(),
-                'user_id': str(user_id)
-            })
+            with self._staged(batch) as staged:
+                staged.push(f'user_inputs/{user_id}/{input_type}', {
+                    **input_data,
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'user_id': str(user_id)
+                })
             logger.info(f"User input saved for user {user_id}, type: {input_type}")
             return True
         except Exception as e:
             logger.error(f"Failed to save user input: {e}")
             return False
     
-    def save_negotiation(self, user_id, product_id, negotiation_data):
+    def save_negotiation(self, user_id, product_id, negotiation_data, batch=None):
         """Save negotiation data to Firebase"""
         if not self.initialized:
             logger.error("Firebase not initialized")
             return False
         
         try:
-            negotiation_ref = self.db_realtime.child('negotiations').push()
-            negotiation_ref.set({
-                **negotiation_data,
-                'user_id': str(user_id),
-                'product_id': product_id,
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            with self._staged(batch) as staged:
+                stage_negotiation(staged, {
+                    **negotiation_data,
+                    'user_id': str(user_id),
+                    'product_id': product_id,
+                    'timestamp': datetime.utcnow().isoformat()
+                })
             logger.info(f"Negotiation saved for user {user_id}, product {product_id}")
             return True
         except Exception as e:
             logger.error(f"Failed to save negotiation: {e}")
             return False
     
-    def save_price_history(self, product_id, price_data):
+    def save_negotiation_batch(self, user_id, negotiations, summary):
+        """Save many negotiations plus one input and one activity record in a single update"""
+        if not self.initialized:
+            logger.error("Firebase not initialized")
+            return False
+        
+        try:
+            timestamp = datetime.utcnow().isoformat()
+            with self.batch() as batch:
+                for negotiation in negotiations:
+                    stage_negotiation(batch, {
+                        **negotiation,
+                        'user_id': str(user_id),
+                        'timestamp': timestamp
+                    })
+                batch.push(f'user_inputs/{user_id}/negotiation_batch', {
+                    **summary,
+                    'user_id': str(user_id),
+                    'timestamp': timestamp
+                })
+                batch.push(f'user_activities/{user_id}', {
+                    **summary,
+                    'activity_type': 'negotiation_batch',
+                    'user_id': str(user_id),
+                    'timestamp': timestamp
+                })
+            logger.info(f"Saved {len(negotiations)} negotiations for user {user_id} in one update")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save negotiation batch: {e}")
+            return False
+    
+    def save_price_history(self, product_id, price_data, batch=None):
         """Save detailed price history to Firebase"""
         if not self.initialized:
             logger.error("Firebase not initialized")
             return False
         
         try:
-            price_ref = self.db_realtime.child('price_history').child(product_id).push()
-            price_ref.set({
-                **price_data,
-                'product_id': product_id,
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            with self._staged(batch) as staged:
+                staged.push(f'price_history/{product_id}', {
+                    **price_data,
+                    'product_id': product_id,
+                    'timestamp': datetime.utcnow().isoformat()
+                })
             logger.info(f"Price history saved for product {product_id}")
             return True
         except Exception as e:
             logger.error(f"Failed to save price history: {e}")
             return False
     
-    def save_user_activity(self, user_id, activity_type, activity_data):
+    def save_user_activity(self, user_id, activity_type, activity_data, batch=None):
         """Save user activity and interactions to Firebase"""
         if not self.initialized:
             logger.error("Firebase not initialized")
             return False
         
         try:
-            activity_ref = self.db_realtime.child('user_activities').child(str(user_id)).push()
-            activity_ref.set({
-                **activity_data,
-                'activity_type': activity_type,
-                'user_id': str(user_id),
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            with self._staged(batch) as staged:
+                staged.push(f'user_activities/{user_id}', {
+                    **activity_data,
+                    'activity_type': activity_type,
+                    'user_id': str(user_id),
+                    'timestamp': datetime.utcnow().isoformat()
+                })
             logger.info(f"User activity saved for user {user_id}, type: {activity_type}")
             return True
         except Exception as e:
             logger.error(f"Failed to save user activity: {e}")
             return False
     
-    def save_product_metadata(self, product_id, metadata):
+    def save_product_metadata(self, product_id, metadata, batch=None):
         """Save product metadata (images, descriptions, categories) to Firebase"""
         if not self.initialized:
             logger.error("Firebase not initialized")
             return False
         
         try:
-            metadata_ref = self.db_realtime.child('product_metadata').child(product_id)
-            metadata_ref.set({
-                **metadata,
-                'product_id': product_id,
-                'last_updated': datetime.utcnow().isoformat()
-            })
+            with self._staged(batch) as staged:
+                staged.set(f'product_metadata/{product_id}', {
+                    **metadata,
+                    'product_id': product_id,
+                    'last_updated': datetime.utcnow().isoformat()
+                })
             logger.info(f"Product metadata saved for product {product_id}")
             return True
         except Exception as e:
@@ -300,26 +511,29 @@ class FirebaseService:
             return False
     
     def get_user_data(self, user_id):
-        """Get all user-related data from Firebase"""
+        """Get all user-related data from Firebase (cached, do not mutate)"""
         if not self.initialized:
             logger.error("Firebase not initialized")
             return None
         
+        return self.cache.get(('user', str(user_id)), 'all', lambda: self._read_user_data(user_id))
+    
+    def _read_user_data(self, user_id):
         try:
             user_data = {}
             
             # Get user inputs
-            inputs = self.db_realtime.child('user_inputs').child(str(user_id)).get()
+            inputs = self.backend.get(f'user_inputs/{user_id}')
             if inputs:
                 user_data['inputs'] = inputs
             
             # Get user activities
-            activities = self.db_realtime.child('user_activities').child(str(user_id)).get()
+            activities = self.backend.get(f'user_activities/{user_id}')
             if activities:
                 user_data['activities'] = activities
             
             # Get user negotiations
-            negotiations = self.db_realtime.child('negotiations').order_by_child('user_id').equal_to(str(user_id)).get()
+            negotiations = self.backend.get(f'negotiations_by_user/{user_id}')
             if negotiations:
                 user_data['negotiations'] = negotiations
             
@@ -328,27 +542,98 @@ class FirebaseService:
             logger.error(f"Failed to get user data: {e}")
             return None
     
+    def _user_category_path(self, user_id, category):
+        if category == 'activities':
+            return f'user_activities/{user_id}'
+        kind, _, input_type = category.partition('/')
+        if kind == 'inputs' and input_type and '/' not in input_type:
+            return f'user_inputs/{user_id}/{input_type}'
+        if category == 'negotiations':
+            return f'negotiations_by_user/{user_id}'
+        raise ValueError(f"Unknown user data category: {category}")
+    
+    def get_user_data_page(self, user_id, category, cursor=None, limit=USER_DATA_PAGE_SIZE):
+        """Newest-first page of one category of user data ('activities', 'negotiations' or 'inputs/<input_type>').
+        
+        Returns {'items': {key: record}, 'next_cursor': key}; pass next_cursor back
+        to get the records before this page, it is None on the last page.
+        """
+        if not self.initialized:
+            logger.error("Firebase not initialized")
+            return None
+        
+        path = self._user_category_path(user_id, category)
+        limit = max(1, min(int(limit), MAX_USER_DATA_PAGE_SIZE))
+        return self.cache.get(
+            ('user', str(user_id)), ('page', category, cursor, limit),
+            lambda: self._read_user_data_page(path, cursor, limit)
+        )
+    
+    def _read_user_data_page(self, path, cursor, limit):
+        try:
+            # One extra record tells whether there is another page; the cursor itself is re-read and dropped
+            fetch = limit + 1 + (cursor is not None)
+            records = self.backend.get(path, order_by='$key', end_at=cursor, limit_to_last=fetch) or {}
+            keys = sorted(records)
+            if cursor is not None and keys and keys[-1] == cursor:
+                keys.pop()
+            has_more = len(keys) > limit
+            keys = keys[-limit:]
+            return {
+                'items': {key: records[key] for key in keys},
+                'next_cursor': keys[0] if has_more else None
+            }
+        except Exception as e:
+            logger.error(f"Failed to get user data page: {e}")
+            return None
+    
+    def get_user_data_summary(self, user_id):
+        """Record counts per category of user data, read without the records themselves"""
+        if not self.initialized:
+            logger.error("Firebase not initialized")
+            return None
+        
+        return self.cache.get(('user', str(user_id)), 'summary', lambda: self._read_user_data_summary(user_id))
+    
+    def _read_user_data_summary(self, user_id):
+        try:
+            input_types = self.backend.get(f'user_inputs/{user_id}', shallow=True) or {}
+            return {
+                'inputs': {
+                    input_type: len(self.backend.get(f'user_inputs/{user_id}/{input_type}', shallow=True) or {})
+                    for input_type in sorted(input_types)
+                },
+                'activities': len(self.backend.get(f'user_activities/{user_id}', shallow=True) or {}),
+                'negotiations': len(self.backend.get(f'negotiations_by_user/{user_id}', shallow=True) or {})
+            }
+        except Exception as e:
+            logger.error(f"Failed to get user data summary: {e}")
+            return None
+    
     def get_product_analytics(self, product_id):
-        """Get comprehensive product analytics from Firebase"""
+        """Get comprehensive product analytics from Firebase (cached, do not mutate)"""
         if not self.initialized:
             logger.error("Firebase not initialized")
             return None
         
+        return self.cache.get(('product', product_id), 'analytics', lambda: self._read_product_analytics(product_id))
+    
+    def _read_product_analytics(self, product_id):
         try:
             analytics = {}
             
             # Get price history
-            price_history = self.db_realtime.child('price_history').child(product_id).get()
+            price_history = self.backend.get(f'price_history/{product_id}')
             if price_history:
                 analytics['price_history'] = price_history
             
             # Get negotiations for this product
-            negotiations = self.db_realtime.child('negotiations').order_by_child('product_id').equal_to(product_id).get()
+            negotiations = self.backend.get(f'negotiations_by_product/{product_id}')
             if negotiations:
                 analytics['negotiations'] = negotiations
             
             # Get product metadata
-            metadata = self.db_realtime.child('product_metadata').child(product_id).get()
+            metadata = self.backend.get(f'product_metadata/{product_id}')
             if metadata:
                 analytics['metadata'] = metadata
             
@@ -0,0 +1,329 @@
+"""
+Durable outbox for Realtime Database writes: stored in SQLite first, delivered in order by a background replayer
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import threading
+import logging
+from firebase_writer import MAX_BATCH, BACKOFF_SECONDS, MAX_BACKOFF_SECONDS, SHUTDOWN_FLUSH_SECONDS, PathSet
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_FILE = os.environ.get('FIREBASE_OUTBOX_FILE', 'firebase_outbox.db')
+# Each delivered update also writes a receipt per outbox entry under this node, bucketed by day
+RECEIPTS_PATH = '_outbox_receipts'
+RECEIPT_RETENTION_DAYS = 7
+# Only the holder of the lease delivers; it renews it on every pass and others take over once it lapses
+LEASE_SECONDS = float(os.environ.get('FIREBASE_OUTBOX_LEASE_SECONDS', 60))
+# How often the outbox is checked for entries appended by other processes, and for a free lease
+POLL_SECONDS = 1.0
+# firebase_admin error codes meaning the database refused the data itself; any other failure is retried
+REJECTED_CODES = {'INVALID_ARGUMENT', 'FAILED_PRECONDITION', 'OUT_OF_RANGE'}
+
+def receipt_path(key, created_at):
+    return f"{RECEIPTS_PATH}/{time.strftime('%Y-%m-%d', time.gmtime(created_at))}/{key}"
+
+def is_retryable(error):
+    """False only for writes that can never succeed: unserialisable data or a rejection by the database.
+
+    Anything unrecognised is retried, since outages surface in many forms
+    (e.g. google.auth TransportError or RefreshError while a token refresh
+    fails), and retrying a bad write only delays the entries behind it.
+    """
+    if isinstance(error, (ValueError, TypeError)):
+        return False
+    return getattr(error, 'code', None) not in REJECTED_CODES
+
+class FirebaseOutbox:
+    """Append-only SQLite (WAL) log of Realtime Database updates.
+
+    `append({path: value})` returns once the entry is committed and synced
+    to disk, so a write survives crashes and outages. A background thread
+    delivers entries in append order, merging neighbours into one
+    multi-path update of up to MAX_BATCH paths, and deletes them only after
+    `write(updates)` succeeds. Outages (see `is_retryable`) are retried with
+    capped backoff for as long as it takes. A write that is rejected
+    outright is retried alone to find the entry at fault, which is moved
+    to the `outbox_dead` table and logged so the entries behind it go on.
+
+    Any number of processes may append to one file, but only the one
+    holding the lease row delivers, so entries are sent once and in order
+    (e.g. with both processes of the Flask reloader running).
+
+    Every entry has an idempotency key, and the update that delivers it
+    also writes `_outbox_receipts/<day>/<key>`. An update is atomic, so when a
+    write fails ambiguously (e.g. a timeout after the server applied it) a
+    receipt found on the next attempt means the batch landed and is not
+    sent again. The same check runs on the first batch after starting or
+    taking over the lease, for entries a previous holder sent but did not
+    get to delete. Appending with a key that is already queued is a no-op.
+    Receipts older than RECEIPT_RETENTION_DAYS are deleted once a day.
+    """
+
+    def __init__(self, write, read=None, path=OUTBOX_FILE):
+        self._write = write
+        self._read = read
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE NOT NULL, '
+            'updates TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox_dead ('
+            'seq INTEGER PRIMARY KEY, key TEXT NOT NULL, updates TEXT NOT NULL, '
+            'created_at REAL NOT NULL, failed_at REAL NOT NULL, error TEXT NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox_lease ('
+            'id INTEGER PRIMARY KEY CHECK (id = 1), owner TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self.owner = uuid.uuid4().hex
+        # None until the replayer first tries for the lease
+        self.leader = None
+        self._lease_until = 0
+        self._released = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {'appended': 0, 'delivered': 0, 'batches': 0, 'retries': 0, 'duplicates': 0, 'dead': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='firebase-outbox')
+                self._thread.start()
+                # Run in reverse: flush first, then hand the lease over
+                atexit.register(self.release)
+                atexit.register(self.flush, SHUTDOWN_FLUSH_SECONDS)
+        self._wake.set()
+        return self
+
+    def _acquire(self):
+        # Take or renew the lease; True while this instance is the one replayer for the file
+        if self._released:
+            self.leader = False
+            return False
+        now = time.time()
+        if self.leader and now < self._lease_until - LEASE_SECONDS / 2:
+            return True
+        with self._lock:
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                row = self._conn.execute('SELECT owner, expires_at FROM outbox_lease WHERE id = 1').fetchone()
+                held = row is None or row[0] == self.owner or row[1] < now
+                if held:
+                    self._lease_until = now + LEASE_SECONDS
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO outbox_lease (id, owner, expires_at) VALUES (1, ?, ?)',
+                        (self.owner, self._lease_until)
+                    )
+                self._conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                logger.warning(f"Could not renew the outbox lease: {e}")
+                held = False
+        if held and not self.leader:
+            logger.info(f"Outbox replayer started for {self.path}")
+        elif self.leader and not held:
+            logger.warning(f"Outbox replayer lost the lease for {self.path}")
+        self.leader = held
+        return held
+
+    def release(self):
+        """Give up the lease so another process can take over without waiting for it to lapse"""
+        self._released = True
+        with self._lock:
+            self._conn.execute('DELETE FROM outbox_lease WHERE owner = ?', (self.owner,))
+        self.leader = False
+
+    def append(self, updates, key=None):
+        """Durably queue one update of {path: value}; returns its idempotency key"""
+        key = key or uuid.uuid4().hex
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO outbox (key, updates, created_at) VALUES (?, ?, ?)',
+                (key, json.dumps(updates), time.time())
+            )
+        if cursor.rowcount:
+            self.stats['appended'] += 1
+        else:
+            self.stats['duplicates'] += 1
+        self._wake.set()
+        return key
+
+    def _next_batch(self, limit=MAX_BATCH):
+        # Oldest entries first, stopping before one that touches a path already in the batch
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT seq, key, updates, created_at FROM outbox ORDER BY seq LIMIT ?', (limit,)
+            ).fetchall()
+        batch, paths, seqs, receipts = {}, PathSet(), [], []
+        for seq, key, updates, created_at in rows:
+            updates = json.loads(updates)
+            if batch and (len(batch) + len(updates) + len(receipts) + 1 > MAX_BATCH
+                          or any(paths.overlaps(path) for path in updates)):
+                break
+            for path in updates:
+                paths.add(path)
+            batch.update(updates)
+            seqs.append(seq)
+            receipts.append(receipt_path(key, created_at))
+        return batch, seqs, receipts
+
+    def _delivered(self, receipts, exact):
+        """How many leading entries of a batch have already been applied.
+
+        An update is atomic, so for a batch retried exactly as it was sent
+        the first receipt answers for all of it. A batch sent by an earlier
+        holder may have been shorter, but it started at the same oldest
+        entry, so receipts are read in order up to the first missing one.
+        """
+        if self._read is None:
+            return 0
+        try:
+            if exact:
+                return len(receipts) if self._read(receipts[0]) is not None else 0
+            count = 0
+            for path in receipts:
+                if self._read(path) is None:
+                    break
+                count += 1
+            return count
+        except Exception:
+            return 0
+
+    def _delete(self, seqs):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM outbox WHERE seq IN ({','.join('?' * len(seqs))})", seqs)
+
+    def _dead_letter(self, seq, error):
+        # Move a rejected entry aside in one transaction so it stops blocking the ones behind it
+        with self._lock:
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO outbox_dead (seq, key, updates, created_at, failed_at, error) '
+                    'SELECT seq, key, updates, created_at, ?, ? FROM outbox WHERE seq = ?',
+                    (time.time(), f"{type(error).__name__}: {error}", seq)
+                )
+                self._conn.execute('DELETE FROM outbox WHERE seq = ?', (seq,))
+                self._conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                logger.error(f"Could not move outbox entry {seq} to outbox_dead: {e}")
+                return
+        self.stats['dead'] += 1
+        logger.error(f"Outbox entry {seq} was rejected and moved to outbox_dead: {error}")
+
+    def _prune_receipts(self):
+        if self._read is None:
+            return
+        cutoff = time.strftime('%Y-%m-%d', time.gmtime(time.time() - RECEIPT_RETENTION_DAYS * 86400))
+        try:
+            days = self._read(RECEIPTS_PATH, shallow=True) or {}
+            old = {f'{RECEIPTS_PATH}/{day}': None for day in days if day < cutoff}
+            if old:
+                self._write(old)
+        except Exception as e:
+            logger.warning(f"Could not prune outbox receipts: {e}")
+
+    def _run(self):
+        delay = BACKOFF_SECONDS
+        retry = None
+        check = True
+        isolate_through = None
+        pruned_on = None
+        while True:
+            if not self._acquire():
+                # Another process delivers; check back for a lapsed lease
+                retry, check, isolate_through = None, True, None
+                self._wake.wait(timeout=POLL_SECONDS)
+                self._wake.clear()
+                continue
+
+            today = time.strftime('%Y-%m-%d', time.gmtime())
+            if pruned_on != today:
+                self._prune_receipts()
+                pruned_on = today
+
+            # A failed batch is retried exactly as it was, so its receipt check stays valid.
+            # After a rejected batch its entries are sent one at a time to find the bad one.
+            batch, seqs, receipts = retry or self._next_batch(1 if isolate_through is not None else MAX_BATCH)
+            if not seqs:
+                isolate_through = None
+                self._wake.wait(timeout=POLL_SECONDS)
+                self._wake.clear()
+                continue
+            if isolate_through is not None and seqs[-1] >= isolate_through:
+                isolate_through = None
+
+            try:
+                delivered = self._delivered(receipts, exact=retry is not None) if (retry or check) else 0
+                check = False
+                if delivered < len(seqs):
+                    if delivered:
+                        # Only a prefix was sent before; the rest goes out as the next batch
+                        self._delete(seqs[:delivered])
+                        self.stats['delivered'] += delivered
+                        retry = None
+                        continue
+                    delivered_at = time.time()
+                    self._write({**batch, **{path: delivered_at for path in receipts}})
+            except Exception as e:
+                if is_retryable(e):
+                    retry = (batch, seqs, receipts)
+                    self.stats['retries'] += 1
+                    logger.warning(f"Outbox delivery of {len(seqs)} writes failed, retrying in {delay:.1f}s: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+                elif len(seqs) > 1:
+                    retry = None
+                    isolate_through = seqs[-1]
+                    logger.warning(f"Outbox batch of {len(seqs)} writes was rejected, sending them one by one: {e}")
+                else:
+                    retry = None
+                    self._dead_letter(seqs[0], e)
+                continue
+
+            self._delete(seqs)
+            self.stats['delivered'] += len(seqs)
+            self.stats['batches'] += 1
+            delay = BACKOFF_SECONDS
+            retry = None
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def dead_letters(self, limit=100):
+        """Rejected entries, oldest first, as dicts"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT seq, key, updates, created_at, failed_at, error FROM outbox_dead ORDER BY seq LIMIT ?', (limit,)
+            ).fetchall()
+        return [
+            {'seq': seq, 'key': key, 'updates': json.loads(updates), 'created_at': created_at,
+             'failed_at': failed_at, 'error': error}
+            for seq, key, updates, created_at, failed_at, error in rows
+        ]
+
+    def flush(self, timeout=None):
+        """Wait until every stored write has been delivered; False on timeout (they stay stored)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if self._thread is None or self.leader is False or (deadline is not None and time.monotonic() >= deadline):
+                logger.warning(f"Firebase outbox not drained ({self.pending()} pending), will resume on restart")
+                return False
+            time.sleep(0.05)
+        return True
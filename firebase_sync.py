@@ -0,0 +1,134 @@
+"""
+Delta sync of the local product catalogue to Firestore, in batch-sized chunks committed in parallel
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+
+logger = logging.getLogger(__name__)
+
+SYNC_STATE_FILE = os.environ.get('FIREBASE_SYNC_STATE_FILE', 'firebase_sync_state.json')
+# Firestore accepts at most 500 writes per batch
+SYNC_CHUNK_SIZE = 500
+SYNC_WORKERS = int(os.environ.get('FIREBASE_SYNC_WORKERS', 4))
+SYNC_MAX_ATTEMPTS = 4
+SYNC_BACKOFF_SECONDS = 0.5
+
+def content_hash(record):
+    """Stable hash of a product record's content"""
+    encoded = json.dumps(record, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+class ProductSync:
+    """Sends only the products that changed since the last successful sync.
+
+    The hash of every synced record is kept in a local state file. A sync
+    compares the catalogue against it, splits the new and changed products
+    into chunks of SYNC_CHUNK_SIZE and passes each chunk, a list of
+    (product_id, record or None to delete), to `commit(chunk)` on a pool of
+    SYNC_WORKERS threads, retrying failures with backoff. Hashes are updated
+    per committed chunk, so a partly failed sync resumes where it stopped.
+
+    Products synced before but missing locally are only deleted remotely
+    with `prune=True`, and never when the local catalogue is empty (a
+    failed load must not wipe the remote one).
+    """
+
+    def __init__(self, commit, state_path=SYNC_STATE_FILE):
+        self._commit = commit
+        self.state_path = state_path
+        self._hashes = None
+        self._lock = threading.Lock()
+
+    def _load_state(self):
+        if self._hashes is None:
+            try:
+                with open(self.state_path, 'r') as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+        return self._hashes
+
+    def _save_state(self):
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._hashes, f)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving sync state: {e}")
+
+    def plan(self, products, full=False, prune=False):
+        """(changes, unchanged count): what a sync of `products` would send"""
+        if prune and not products:
+            raise ValueError("Refusing to prune remote products: the local catalogue is empty")
+        with self._lock:
+            hashes = {} if full else dict(self._load_state())
+        changes = []
+        unchanged = 0
+        for product_id, record in products.items():
+            digest = content_hash(record)
+            if hashes.get(product_id) == digest:
+                unchanged += 1
+            else:
+                changes.append((product_id, record, digest))
+        if prune:
+            for product_id in hashes.keys() - products.keys():
+                changes.append((product_id, None, None))
+        return changes, unchanged
+
+    def _commit_with_retry(self, chunk):
+        delay = SYNC_BACKOFF_SECONDS
+        for attempt in range(1, SYNC_MAX_ATTEMPTS + 1):
+            try:
+                self._commit([(product_id, record) for product_id, record, _ in chunk])
+                return True
+            except Exception as e:
+                if attempt == SYNC_MAX_ATTEMPTS:
+                    logger.error(f"Giving up on a sync chunk of {len(chunk)} products after {attempt} attempts: {e}")
+                    return False
+                logger.warning(f"Sync chunk failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay *= 2
+
+    def sync(self, products, full=False, prune=False):
+        """Sync the catalogue; `full` resends every product, `prune` deletes remote ones gone locally.
+        Returns counts of what happened."""
+        changes, unchanged = self.plan(products, full, prune)
+        chunks = [changes[i:i + SYNC_CHUNK_SIZE] for i in range(0, len(changes), SYNC_CHUNK_SIZE)]
+        report = {
+            'changed': sum(1 for _, record, _ in changes if record is not None),
+            'deleted': sum(1 for _, record, _ in changes if record is None),
+            'unchanged': unchanged,
+            'chunks': len(chunks),
+            'synced': 0,
+            'failed': 0
+        }
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=max(1, min(SYNC_WORKERS, len(chunks)))) as pool:
+            futures = {pool.submit(self._commit_with_retry, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                with self._lock:
+                    hashes = self._load_state()
+                    if future.result():
+                        for product_id, _, digest in chunk:
+                            if digest is None:
+                                hashes.pop(product_id, None)
+                            else:
+                                hashes[product_id] = digest
+                        report['synced'] += len(chunk)
+                    else:
+                        report['failed'] += len(chunk)
+                    self._save_state()
+                logger.info(f"Synced {report['synced']}/{len(changes)} changed products")
+
+        report['seconds'] = round(time.monotonic() - started, 3)
+        logger.info(f"Sync finished: {report}")
+        return report
@@ -0,0 +1,170 @@
+"""
+Write-behind queue for Firebase writes, flushed in batches off the request thread
+"""
+
+import os
+import time
+import atexit
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.environ.get('FIREBASE_QUEUE_SIZE', 10000))
+# How long a caller may block on a full queue before its write is dropped
+ENQUEUE_TIMEOUT = float(os.environ.get('FIREBASE_ENQUEUE_TIMEOUT', 0.5))
+MAX_BATCH = 500
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30
+SHUTDOWN_FLUSH_SECONDS = 10
+
+class PathSet:
+    """Paths of one multi-path update plus all their ancestors, so an overlap check costs O(depth).
+
+    A multi-path update may not contain a path together with one of its ancestors.
+    """
+
+    def __init__(self, paths=()):
+        self.paths = set()
+        self.ancestors = set()
+        for path in paths:
+            self.add(path)
+
+    @staticmethod
+    def _prefixes(path):
+        parts = path.split('/')
+        return ['/'.join(parts[:i]) for i in range(1, len(parts))]
+
+    def overlaps(self, path):
+        """True if `path` equals, contains or lies under a path already in the set"""
+        return (path in self.paths or path in self.ancestors
+                or any(prefix in self.paths for prefix in self._prefixes(path)))
+
+    def add(self, path):
+        self.paths.add(path)
+        self.ancestors.update(self._prefixes(path))
+
+    def __len__(self):
+        return len(self.paths)
+
+class WriteBehindQueue:
+    """Bounded in-process queue of Realtime Database writes.
+
+    `enqueue({path: value, ...})` returns immediately; a background thread
+    merges queued writes into multi-path updates of up to MAX_BATCH paths
+    and passes each to `write(updates)`, retrying failures with exponential
+    backoff. If a merged update still fails, its writes are sent one at a
+    time and only those that fail on their own are dropped. Writes keep
+    their order. When the queue is full the caller blocks for up to
+    ENQUEUE_TIMEOUT, then the write is dropped and counted.
+    """
+
+    def __init__(self, write, maxsize=QUEUE_SIZE):
+        self._write = write
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._held = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'written': 0, 'batches': 0, 'retries': 0, 'dropped': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='firebase-writer')
+                self._thread.start()
+                atexit.register(self.flush, SHUTDOWN_FLUSH_SECONDS)
+        return self
+
+    def _count(self, key, n=1):
+        # Counters are bumped from caller threads and the writer thread alike
+        with self._lock:
+            self.stats[key] += n
+
+    def enqueue(self, updates):
+        """Queue one write of {path: value}; False if it had to be dropped"""
+        try:
+            self._queue.put(dict(updates), timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self._count('dropped')
+            logger.error(f"Firebase write queue full, dropped write to {', '.join(updates)}")
+            return False
+        self._count('enqueued')
+        return True
+
+    def _next_batch(self):
+        # Block for the first write, then take whatever else is already queued
+        first = self._held or self._queue.get()
+        self._held = None
+        writes = [first]
+        batch, paths = dict(first), PathSet(first)
+        while len(batch) < MAX_BATCH:
+            try:
+                updates = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if any(paths.overlaps(path) for path in updates):
+                # Conflicting paths go in the next batch, which keeps writes in order
+                self._held = updates
+                break
+            for path in updates:
+                paths.add(path)
+            batch.update(updates)
+            writes.append(updates)
+        return batch, writes
+
+    def _write_with_retry(self, batch):
+        # Retries with backoff; the last error is raised after MAX_ATTEMPTS
+        delay = BACKOFF_SECONDS
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                self._write(batch)
+                return
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                self._count('retries')
+                logger.warning(f"Firebase write failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+
+    def _run(self):
+        while True:
+            batch, writes = self._next_batch()
+            try:
+                self._write_with_retry(batch)
+                self._count('written', len(writes))
+                self._count('batches')
+            except Exception as e:
+                if len(writes) == 1:
+                    self._count('dropped')
+                    logger.error(f"Giving up on a Firebase write to {', '.join(batch)} after {MAX_ATTEMPTS} attempts: {e}")
+                else:
+                    # One bad write fails the whole merged update: send them one at a time
+                    # so only the writes that fail on their own are dropped
+                    logger.warning(f"Merged update of {len(writes)} Firebase writes failed, sending them one by one: {e}")
+                    for updates in writes:
+                        try:
+                            self._write(updates)
+                            self._count('written')
+                        except Exception as e:
+                            self._count('dropped')
+                            logger.error(f"Dropped Firebase write to {', '.join(updates)}: {e}")
+            for _ in writes:
+                self._queue.task_done()
+
+    def flush(self, timeout=None):
+        """Wait until every queued write has been attempted; False on timeout"""
+        if self._thread is None:
+            return self._queue.empty()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning(f"Firebase write queue not drained at shutdown ({self._queue.qsize()} pending)")
+                return False
+            time.sleep(0.05)
+        return True
+
+    def pending(self):
+        return self._queue.qsize() + (1 if self._held is not None else 0)
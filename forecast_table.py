@@ -0,0 +1,182 @@
+"""
+Precomputed forecast table, refreshed by a background job
+"""
+
+import os
+import json
+import threading
+import time
+import pandas as pd
+from datetime import datetime
+import logging
+from price_cache import history_version, load_price_frame
+from price_store import get_price_store
+from forecasting import get_trend_forecasts, bootstrap_intervals, FORECAST_DAYS
+
+logger = logging.getLogger(__name__)
+
+FORECAST_TABLE_FILE = os.environ.get('FORECAST_TABLE_FILE', 'forecasts.json')
+FORECAST_TABLE_FORMAT = 2
+# Writes arriving within this many seconds of each other are recomputed as one batch
+FORECAST_JOB_DEBOUNCE_SECONDS = float(os.environ.get('FORECAST_JOB_DEBOUNCE_SECONDS', 2))
+
+class ForecastTable:
+    """Stored forecasts per product, tagged with the history version they were computed from.
+
+    Each point is (date, price, lower, upper), the bounds being the
+    bootstrap prediction interval around the trend forecast. Readers never
+    run the model when a forecast is stored: a stale entry is served as is
+    and queued for the background job; only a product that has never been
+    forecast is computed inline.
+    """
+
+    def __init__(self, path=FORECAST_TABLE_FILE, horizon=FORECAST_DAYS):
+        self.path = path
+        self.horizon = horizon
+        self._entries = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def recompute(self, product_ids):
+        """Forecast the given products in one batch and store the results"""
+        product_ids = list(dict.fromkeys(product_ids))
+        if not product_ids:
+            return {}
+        versions = {pid: history_version(pid) for pid in product_ids}
+        forecasts = get_trend_forecasts().forecast_many(product_ids, self.horizon)
+        for pid, points in forecasts.items():
+            if points:
+                lower, upper = bootstrap_intervals(load_price_frame(pid), self.horizon)
+                forecasts[pid] = [
+                    (date, value, value + lo, value + hi)
+                    for (date, value), lo, hi in zip(points, lower.tolist(), upper.tolist())
+                ]
+        computed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            for pid, points in forecasts.items():
+                self._entries[pid] = {'version': versions[pid], 'computed_at': computed_at, 'points': points}
+        logger.info(f"Recomputed forecasts for {len(forecasts)} products")
+        return forecasts
+
+    def stale(self, product_ids):
+        """Products whose stored forecast is missing or older than their history"""
+        with self._lock:
+            return [
+                pid for pid in product_ids
+                if pid not in self._entries or self._entries[pid]['version'] != history_version(pid)
+            ]
+
+    def lookup_many(self, product_ids):
+        """Stored forecasts for many products (product_id -> [(date, price, lower, upper), ...])"""
+        results = {}
+        missing = []
+        with self._lock:
+            for pid in product_ids:
+                entry = self._entries.get(pid)
+                if entry is None:
+                    missing.append(pid)
+                else:
+                    results[pid] = entry['points']
+        if missing:
+            results.update(self.recompute(missing))
+
+        outdated = [pid for pid in self.stale(results) if pid not in missing]
+        if outdated:
+            self.schedule(outdated)
+        return results
+
+    def lookup(self, product_id):
+        return self.lookup_many([product_id])[product_id]
+
+    def schedule(self, product_ids):
+        """Queue products for the background job"""
+        with self._lock:
+            self._pending.update(product_ids)
+        self._wake.set()
+
+    def observe(self, product_id, rows, version):
+        """Price store listener: queue a recompute after every write"""
+        self.schedule([product_id])
+
+    def run_pending(self, product_ids=None):
+        """Recompute queued products, plus any stale ones among `product_ids`"""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        if product_ids is not None:
+            pending.update(self.stale(product_ids))
+        if pending:
+            self.recompute(sorted(pending))
+            self.save()
+        return len(pending)
+
+    def save(self):
+        """Write the table to disk"""
+        try:
+            with self._lock:
+                table = {
+                    pid: {
+                        'version': list(entry['version']) if entry['version'] is not None else None,
+                        'computed_at': entry['computed_at'],
+                        'points': [[d.isoformat(), *map(float, values)] for d, *values in entry['points']]
+                    }
+                    for pid, entry in self._entries.items()
+                }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'format': FORECAST_TABLE_FORMAT, 'horizon': self.horizon, 'forecasts': table}, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving forecast table: {e}")
+            return False
+
+    def load(self):
+        """Read the table from disk; entries keep their version so stale ones are recomputed"""
+        try:
+            if not os.path.exists(self.path):
+                return False
+            with open(self.path, 'r') as f:
+                table = json.load(f)
+            if table.get('format') != FORECAST_TABLE_FORMAT or table.get('horizon') != self.horizon:
+                logger.info("Forecast table format or horizon changed, ignoring stored forecasts")
+                return False
+            with self._lock:
+                for pid, entry in table['forecasts'].items():
+                    self._entries[pid] = {
+                        'version': tuple(entry['version']) if entry['version'] is not None else None,
+                        'computed_at': entry['computed_at'],
+                        'points': [(pd.Timestamp(d), *values) for d, *values in entry['points']]
+                    }
+            logger.info(f"Loaded {len(table['forecasts'])} stored forecasts")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading forecast table: {e}")
+            return False
+
+    def start(self, product_ids_fn, interval_minutes=60):
+        """Run the job: after writes (debounced) and a full staleness sweep every interval"""
+        def job_loop():
+            while True:
+                try:
+                    if self._wake.wait(timeout=interval_minutes * 60):
+                        # Let the rest of a scrape or ingest batch land first
+                        time.sleep(FORECAST_JOB_DEBOUNCE_SECONDS)
+                        self._wake.clear()
+                        self.run_pending()
+                    else:
+                        self.run_pending(list(product_ids_fn()))
+                except Exception as e:
+                    logger.error(f"Error in forecast job: {e}")
+
+        job_thread = threading.Thread(target=job_loop, daemon=True, name='forecast-job')
+        job_thread.start()
+        return job_thread
+
+# Global forecast table instance
+forecast_table = ForecastTable()
+get_price_store().add_listener(forecast_table.observe)
+
+def get_forecast_table():
+    """Get forecast table instance"""
+    return forecast_table
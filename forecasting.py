@@ -0,0 +1,395 @@
+"""
+Closed-form, vectorized price trend forecasting over elapsed time
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+import logging
+from price_cache import history_version, load_price_frame
+from price_store import get_price_store, to_epoch_seconds
+from snapshot import register_section
+
+logger = logging.getLogger(__name__)
+
+FORECAST_DAYS = 7
+SECONDS_PER_DAY = 86400.0
+# An observation loses half its weight for every HALF_LIFE_DAYS it is older than the newest one
+HALF_LIFE_DAYS = float(os.environ.get('FORECAST_HALF_LIFE_DAYS', 30))
+# Observations spread over less time than this carry no usable slope; the forecast stays flat
+MIN_TREND_SPAN_DAYS = 1.0
+# Prediction interval coverage and the bootstrap behind it
+INTERVAL_LEVEL = 0.9
+BOOTSTRAP_RESAMPLES = 500
+BOOTSTRAP_MAX_OBS = 500
+BOOTSTRAP_TABLE_SIZE = 8192
+
+def decay(age_days, half_life=HALF_LIFE_DAYS):
+    """Weight of an observation `age_days` older than the newest one"""
+    return np.power(0.5, np.asarray(age_days, dtype=float) / half_life)
+
+def trend_sums(groups, t, y, weights, m=None):
+    """Weighted least-squares sums for many series at once.
+
+    `groups` holds the series number (0..m-1) of each observation, `t` its
+    time in days and `y` its price. Every sum the normal equations need is
+    taken with one np.bincount. Returns an (m, 5) array of
+    [sum w, sum w*t, sum w*t^2, sum w*y, sum w*t*y] rows.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.asarray(weights, dtype=float)
+    if m is None:
+        m = int(groups.max()) + 1 if len(groups) else 0
+    return np.column_stack([
+        np.bincount(groups, weights=values, minlength=m)
+        for values in (w, w * t, w * t * t, w * y, w * t * y)
+    ])
+
+def trend_coefficients(sums):
+    """Slopes (per day) and intercepts (at t=0) solving each row of an (m, 5) sums array"""
+    sums = np.atleast_2d(np.asarray(sums, dtype=float))
+    w, wt, wtt, wy, wty = sums.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        denom = w * wtt - wt * wt
+        spread = np.where(w > 0, denom / (w * w), 0.0)
+        usable = spread > (MIN_TREND_SPAN_DAYS / 2) ** 2
+        slopes = np.where(usable, (w * wty - wt * wy) / np.where(usable, denom, 1.0), 0.0)
+        intercepts = np.where(w > 0, (wy - slopes * wt) / np.where(w > 0, w, 1.0), np.nan)
+    return slopes, intercepts
+
+class TrendState:
+    """Exponentially weighted trend of price over elapsed time, updated in O(1).
+
+    Time is measured in days relative to the newest observation, so a
+    forecast k days out is intercept + slope * k. A newer observation shifts
+    the origin and decays the sums; an older one (a back-filled feed) is
+    added at its negative offset with its decayed weight.
+    """
+
+    def __init__(self, last_epoch, sums):
+        self.last_epoch = int(last_epoch)
+        self.sums = np.asarray(sums, dtype=float)
+
+    def update(self, epoch, price):
+        offset = (int(epoch) - self.last_epoch) / SECONDS_PER_DAY
+        if offset > 0:
+            # Re-express the sums with t measured from the new observation (t -> t - offset)
+            w, wt, wtt, wy, wty = self.sums
+            shifted = np.array([
+                w,
+                wt - offset * w,
+                wtt - 2 * offset * wt + offset * offset * w,
+                wy,
+                wty - offset * wy
+            ])
+            self.sums = shifted * float(decay(offset))
+            self.last_epoch = int(epoch)
+            offset = 0.0
+        weight = float(decay(-offset))
+        self.sums = self.sums + weight * np.array([1.0, offset, offset * offset, price, offset * price])
+
+    def to_dict(self):
+        return {'last_epoch': self.last_epoch, 'sums': self.sums.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['last_epoch'], data['sums'])
+
+def build_states(frames):
+    """TrendStates for many price histories in one vectorized pass.
+
+    `frames` maps product_id -> price history DataFrame (Timestamp, Price);
+    products without history are left out.
+    """
+    product_ids = [pid for pid, df in frames.items() if df is not None and len(df)]
+    if not product_ids:
+        return {}
+
+    epochs = [to_epoch_seconds(frames[pid]['Timestamp']) for pid in product_ids]
+    last_epochs = np.array([e.max() for e in epochs], dtype=np.int64)
+    groups = np.repeat(np.arange(len(product_ids)), [len(e) for e in epochs])
+    t = (np.concatenate(epochs) - last_epochs[groups]) / SECONDS_PER_DAY
+    prices = np.concatenate([frames[pid]['Price'].to_numpy(dtype=float) for pid in product_ids])
+
+    sums = trend_sums(groups, t, prices, decay(-t), m=len(product_ids))
+    return {pid: TrendState(last_epochs[i], sums[i]) for i, pid in enumerate(product_ids)}
+
+def forecast_states(states, horizon=FORECAST_DAYS):
+    """Forecast many TrendStates in one solve.
+
+    Returns product_id -> [(date, predicted_price), ...], one point per day
+    after each product's newest observation.
+    """
+    product_ids = list(states)
+    if not product_ids:
+        return {}
+
+    slopes, intercepts = trend_coefficients([states[pid].sums for pid in product_ids])
+    steps = np.arange(1, horizon + 1)
+    values = (intercepts[:, None] + slopes[:, None] * steps).tolist()
+    last_dates = np.array([states[pid].last_epoch for pid in product_ids], dtype='datetime64[s]')
+    dates = last_dates[:, None] + np.timedelta64(1, 'D') * steps
+
+    dates = list(pd.DatetimeIndex(dates.ravel()))
+    return {
+        pid: list(zip(dates[i * horizon:(i + 1) * horizon], values[i]))
+        for i, pid in enumerate(product_ids)
+    }
+
+def forecast_batch(frames, horizon=FORECAST_DAYS):
+    """Forecast many price histories directly; products without history get an empty list"""
+    results = {pid: [] for pid in frames}
+    results.update(forecast_states(build_states(frames), horizon))
+    return results
+
+def linear_forecast(df, horizon=FORECAST_DAYS):
+    """Forecast the next `horizon` days for one price history DataFrame"""
+    return forecast_batch({None: df}, horizon)[None]
+
+def bootstrap_intervals(df, horizon=FORECAST_DAYS, level=INTERVAL_LEVEL, resamples=BOOTSTRAP_RESAMPLES, rng=None):
+    """Prediction interval offsets for the trend forecast, by residual bootstrap.
+
+    The trend is refitted to `resamples` synthetic histories (fitted values
+    plus residuals drawn with the same recency weights as the fit) and each
+    refit is perturbed by one more drawn residual per forecast day. All
+    resamples are drawn and refitted as single matrix operations. Returns
+    (lower, upper) arrays of length `horizon` to add to the point forecast;
+    zeros if there are too few observations.
+    """
+    lower, upper = np.zeros(horizon), np.zeros(horizon)
+    if df is None or len(df) < 3:
+        return lower, upper
+
+    epochs = to_epoch_seconds(df['Timestamp'])
+    order = np.argsort(epochs, kind='stable')[-BOOTSTRAP_MAX_OBS:]
+    t = (epochs[order] - epochs[order[-1]]) / SECONDS_PER_DAY
+    y = df['Price'].to_numpy(dtype=float)[order]
+    w = decay(-t)
+
+    base = np.array([w.sum(), (w * t).sum(), (w * t * t).sum(), (w * y).sum(), (w * t * y).sum()])
+    slope, intercept = (c[0] for c in trend_coefficients(base))
+    fitted = intercept + slope * t
+    residuals = y - fitted
+
+    # Weighted draws through an inverse-CDF lookup table, so every draw is a single array index
+    rng = rng or np.random.default_rng()
+    cdf = np.cumsum(w)
+    cdf /= cdf[-1]
+    table = np.minimum(np.searchsorted(cdf, (np.arange(BOOTSTRAP_TABLE_SIZE) + 0.5) / BOOTSTRAP_TABLE_SIZE), len(y) - 1)
+    draw = lambda shape: table[rng.integers(0, BOOTSTRAP_TABLE_SIZE, size=shape)]
+    synthetic = fitted + residuals[draw((resamples, len(y)))]
+    sums = np.column_stack([
+        np.full(resamples, base[0]), np.full(resamples, base[1]), np.full(resamples, base[2]),
+        synthetic @ w, synthetic @ (w * t)
+    ])
+    slopes, intercepts = trend_coefficients(sums)
+
+    steps = np.arange(1, horizon + 1)
+    noise = residuals[draw((resamples, horizon))]
+    deviations = (intercepts[:, None] - intercept) + (slopes[:, None] - slope) * steps + noise
+    tail = (1 - level) / 2
+    lower, upper = np.quantile(deviations, [tail, 1 - tail], axis=0)
+    return lower, upper
+
+class TrendForecasts:
+    """Per-product TrendStates kept current by price store writes.
+
+    A state is built from history the first time a product is forecast and
+    is updated from new rows afterwards, so forecasts never re-read history.
+    Each state carries the history version it reflects; a state whose file
+    changed outside the price store is rebuilt on the next forecast.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _ensure(self, product_ids):
+        # Build states for new products and rebuild those whose history changed outside the price store
+        versions = {pid: history_version(pid) for pid in product_ids}
+        with self._lock:
+            stale = [
+                pid for pid in product_ids
+                if pid not in self._states or self._versions.get(pid) != versions[pid]
+            ]
+        if not stale:
+            return
+        built = build_states({pid: load_price_frame(pid) for pid in stale})
+        with self._lock:
+            for pid in stale:
+                if pid in built:
+                    self._states[pid] = built[pid]
+                    # A history that changed during the read gets no version and is rebuilt on its next use
+                    self._versions[pid] = versions[pid] if history_version(pid) == versions[pid] else None
+                else:
+                    self._states.pop(pid, None)
+                    self._versions.pop(pid, None)
+
+    def observe(self, product_id, rows, version):
+        """Price store listener: fold newly stored rows into the product's trend"""
+        with self._lock:
+            state = self._states.get(product_id)
+            if state is not None:
+                if self._versions.get(product_id) == version.before:
+                    epochs = to_epoch_seconds(rows['Timestamp'])
+                    for epoch, price in zip(epochs.tolist(), rows['Price'].to_numpy(dtype=float).tolist()):
+                        state.update(epoch, price)
+                    self._versions[product_id] = version.after
+                elif self._versions.get(product_id) != version.after:
+                    # Built from some other version of the history: rebuild on next use
+                    del self._states[product_id]
+                    self._versions.pop(product_id, None)
+                return
+        # First sighting: build from the full history, which already includes these rows
+        self._ensure([product_id])
+
+    def forecast(self, product_id, horizon=FORECAST_DAYS):
+        """Forecast for one product; empty if it has no history"""
+        return self.forecast_many([product_id], horizon)[product_id]
+
+    def forecast_many(self, product_ids, horizon=FORECAST_DAYS):
+        """Forecasts for many products; those without history get an empty list"""
+        self._ensure(product_ids)
+        with self._lock:
+            states = {
+                pid: TrendState(self._states[pid].last_epoch, self._states[pid].sums)
+                for pid in product_ids if pid in self._states
+            }
+        results = {pid: [] for pid in product_ids}
+        results.update(forecast_states(states, horizon))
+        return results
+
+    def dump(self):
+        with self._lock:
+            return {
+                product_id: (self._versions.get(product_id), state.to_dict())
+                for product_id, state in self._states.items()
+            }
+
+    def load(self, product_id, version, payload):
+        with self._lock:
+            self._states[product_id] = TrendState.from_dict(payload)
+            self._versions[product_id] = version
+
+class Forecaster(ABC):
+    """A forecast model evaluated on many windows at once.
+
+    `fit(t, y)` takes (m, w) arrays of observation times (days relative to
+    each window's last observation, so t[:, -1] == 0) and prices, and
+    returns fitted parameters. `predict(params, steps)` returns (m, h)
+    predictions `steps` days after each window's last observation.
+    """
+    name = None
+
+    @abstractmethod
+    def fit(self, t, y):
+        """Fitted parameters for (m, w) arrays of times and prices"""
+
+    @abstractmethod
+    def predict(self, params, steps):
+        """(m, h) predictions `steps` days after each window's last observation"""
+
+class LinearTrend(Forecaster):
+    """Exponentially weighted linear trend over elapsed time (the live model)"""
+    name = 'linear'
+
+    def __init__(self, half_life=HALF_LIFE_DAYS):
+        self.half_life = half_life
+
+    def fit(self, t, y):
+        w = decay(-t, self.half_life)
+        sums = np.column_stack([w.sum(1), (w * t).sum(1), (w * t * t).sum(1), (w * y).sum(1), (w * t * y).sum(1)])
+        return trend_coefficients(sums)
+
+    def predict(self, params, steps):
+        slopes, intercepts = params
+        return intercepts[:, None] + slopes[:, None] * steps
+
+class EWMA(Forecaster):
+    """Exponentially weighted moving average level, forecast flat"""
+    name = 'ewma'
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+
+    def fit(self, t, y):
+        # Closed form of l_i = a*y_i + (1-a)*l_(i-1) with l_0 = y_0, as one dot product per window
+        w = y.shape[1]
+        weights = self.alpha * (1 - self.alpha) ** np.arange(w - 1, -1, -1, dtype=float)
+        weights[0] = (1 - self.alpha) ** (w - 1)
+        return y @ weights
+
+    def predict(self, params, steps):
+        return np.repeat(params[:, None], len(steps), axis=1)
+
+class Holt(Forecaster):
+    """Holt's linear exponential smoothing; the per-observation trend is scaled to days by the mean spacing"""
+    name = 'holt'
+
+    def __init__(self, alpha=0.5, beta=0.1):
+        self.alpha = alpha
+        self.beta = beta
+
+    def fit(self, t, y):
+        level = y[:, 0].copy()
+        trend = np.zeros(len(y))
+        for i in range(1, y.shape[1]):
+            previous = level
+            level = self.alpha * y[:, i] + (1 - self.alpha) * (level + trend)
+            trend = self.beta * (level - previous) + (1 - self.beta) * trend
+        with np.errstate(invalid='ignore', divide='ignore'):
+            spacing = -t[:, 0] / max(y.shape[1] - 1, 1)
+            per_day = np.where(spacing > 0, trend / np.where(spacing > 0, spacing, 1.0), 0.0)
+        return level, per_day
+
+    def predict(self, params, steps):
+        level, per_day = params
+        return level[:, None] + per_day[:, None] * steps
+
+class SeasonalNaive(Forecaster):
+    """The price observed one period earlier (weekly by default)"""
+    name = 'seasonal_naive'
+
+    def __init__(self, period=7):
+        self.period = period
+
+    def fit(self, t, y):
+        return t, y
+
+    def predict(self, params, steps):
+        t, y = params
+        steps = np.asarray(steps, dtype=float)
+        lag = steps - self.period * np.ceil(steps / self.period)
+        return step_lookup(t, y, np.broadcast_to(lag, (len(t), len(steps))))
+
+def step_lookup(t, y, targets):
+    """Price in effect at each target time: the last observation at or before it, per row.
+
+    `t` and `y` are (m, w) with rows sorted by time, `targets` is (m, h);
+    targets before a row's first observation take its first price. All rows
+    are searched at once by offsetting each row into its own time range.
+    """
+    m, w = t.shape
+    span = max(np.abs(t).max(), np.abs(targets).max()) + 1.0
+    offsets = np.arange(m)[:, None] * 2 * span
+    positions = np.searchsorted((t + offsets).ravel(), (targets + offsets).ravel(), side='right') - 1
+    positions = positions.reshape(m, -1)
+    first = np.arange(m)[:, None] * w
+    return y.ravel()[np.clip(positions, first, first + w - 1)]
+
+# Forecasters available to the backtester, by name
+FORECASTERS = {cls.name: cls for cls in (LinearTrend, EWMA, Holt, SeasonalNaive)}
+
+# Global trend forecasts instance
+trend_forecasts = TrendForecasts()
+get_price_store().add_listener(trend_forecasts.observe)
+register_section('trend_forecast', trend_forecasts.dump, trend_forecasts.load)
+
+def get_trend_forecasts():
+    """Get trend forecasts instance"""
+    return trend_forecasts
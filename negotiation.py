@@ -0,0 +1,61 @@
+"""
+Price negotiation rules, evaluated for many offers at once
+"""
+
+import numpy as np
+
+# Offer outcomes, in the order the rules are checked
+ACCEPT_PRICE = 'accept_price'
+ACCEPT_OFFER = 'accept_offer'
+COUNTER = 'counter'
+TOO_LOW = 'too_low'
+DISCUSS = 'discuss'
+# Only reached through a negotiation session that has run out of rounds
+FINAL_OFFER = 'final_offer'
+
+ACCEPT_RATIO = 0.9
+COUNTER_RATIO = 0.7
+# Floor used when a product has no recorded minimum price (15% discount)
+FALLBACK_MIN_RATIO = 0.85
+
+def evaluate_offers(prices, min_prices, offers):
+    """Apply the negotiation rules to arrays of (price, min_price, offer).
+
+    `min_prices` may contain NaN for products without a recorded minimum.
+    Returns (outcomes, amounts): the outcome of each offer and the price
+    quoted back with it (the asking price, the offer, the counter-offer or
+    the floor).
+    """
+    prices = np.asarray(prices, dtype=float)
+    offers = np.asarray(offers, dtype=float)
+    min_prices = np.asarray(min_prices, dtype=float)
+    # Products without a recorded minimum (NaN) fall back to a 15% discount
+    min_prices = np.where(np.isnan(min_prices), prices * FALLBACK_MIN_RATIO, min_prices)
+
+    conditions = [
+        offers >= prices,
+        offers >= prices * ACCEPT_RATIO,
+        offers >= prices * COUNTER_RATIO,
+        offers < prices * COUNTER_RATIO
+    ]
+    outcomes = np.select(conditions, [ACCEPT_PRICE, ACCEPT_OFFER, COUNTER, TOO_LOW], default=DISCUSS)
+    amounts = np.select(
+        conditions,
+        [prices, offers, np.maximum((offers + prices) // 2, min_prices), min_prices],
+        default=np.nan
+    )
+    return outcomes, amounts
+
+def format_response(outcome, name, offer, amount):
+    """The seller's reply for one evaluated offer"""
+    if outcome == ACCEPT_PRICE:
+        return f"✅ Great! The {name} is yours for ₹{amount}"
+    if outcome == ACCEPT_OFFER:
+        return f"🎉 Deal! I can give you the {name} for ₹{offer}"
+    if outcome == COUNTER:
+        return f"🤝 Hmm, I can’t do ₹{offer}, but how about ₹{amount}?"
+    if outcome == TOO_LOW:
+        return f"😅 That’s too low. Best I can do is ₹{amount}"
+    if outcome == FINAL_OFFER:
+        return f"🛑 I’ve gone as low as I can. My final offer is ₹{amount}"
+    return "Let's discuss further!"
@@ -0,0 +1,224 @@
+"""
+Multi-round negotiation sessions per (user, product), held in a bounded in-memory TTL store
+"""
+
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import logging
+from negotiation import evaluate_offers, ACCEPT_PRICE, ACCEPT_OFFER, COUNTER, TOO_LOW, FINAL_OFFER, FALLBACK_MIN_RATIO
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_MINUTES = float(os.environ.get('NEGOTIATION_SESSION_TTL_MINUTES', 30))
+MAX_SESSIONS = int(os.environ.get('NEGOTIATION_MAX_SESSIONS', 10000))
+# Rounds after which the seller stops conceding and repeats its final offer
+MAX_ROUNDS = int(os.environ.get('NEGOTIATION_MAX_ROUNDS', 8))
+# How often idle sessions are swept out between requests
+SESSION_SWEEP_SECONDS = float(os.environ.get('NEGOTIATION_SESSION_SWEEP_SECONDS', 60))
+
+class NegotiationSession:
+    """One user's negotiation over one product.
+
+    The asking price and floor are fixed when the session opens, so later
+    rounds are judged against the same terms. The seller never raises its
+    counter-offer, accepts any offer that meets it, and concedes (splitting
+    the difference, down to the floor) only when the buyer moves up.
+    """
+
+    def __init__(self, user_id, product_id, price, min_price):
+        self.user_id = str(user_id)
+        self.product_id = product_id
+        self.price = price
+        self.min_price = min_price
+        self.floor = price * FALLBACK_MIN_RATIO if math.isnan(min_price) else min_price
+        self.started_at = datetime.utcnow().isoformat()
+        self.last_active = time.monotonic()
+        self.rounds = 0
+        self.offers = []
+        self.last_counter = None
+        self.concessions = 0
+        self.outcome = None
+        self.final_price = None
+
+    @property
+    def closed(self):
+        return self.outcome is not None
+
+    def respond(self, offer):
+        """Judge the next offer; returns (outcome, quoted price)"""
+        outcomes, amounts = evaluate_offers([self.price], [self.min_price], [offer])
+        outcome, amount = str(outcomes[0]), amounts.tolist()[0]
+        previous_offer = self.offers[-1] if self.offers else None
+
+        if self.last_counter is not None and outcome in (COUNTER, TOO_LOW):
+            if offer >= self.last_counter:
+                outcome, amount = ACCEPT_OFFER, offer
+            elif self.rounds >= MAX_ROUNDS or (previous_offer is not None and offer <= previous_offer):
+                # No concession for stalling or backing off
+                outcome, amount = FINAL_OFFER if self.rounds >= MAX_ROUNDS else COUNTER, self.last_counter
+            elif outcome == COUNTER:
+                amount = max((offer + self.last_counter) // 2, self.floor)
+                if amount < self.last_counter:
+                    self.concessions += 1
+            else:
+                amount = self.last_counter
+
+        self.rounds += 1
+        self.offers.append(offer)
+        self.last_active = time.monotonic()
+        if outcome in (COUNTER, TOO_LOW, FINAL_OFFER):
+            self.last_counter = amount
+        if outcome in (ACCEPT_PRICE, ACCEPT_OFFER):
+            self.outcome, self.final_price = 'accepted', amount
+        return outcome, amount
+
+    def state(self):
+        return {
+            'round': self.rounds,
+            'last_counter': self.last_counter,
+            'concessions': self.concessions,
+            'status': self.outcome or 'open'
+        }
+
+    def summary(self):
+        """What is persisted when the session closes"""
+        return {
+            'user_id': self.user_id,
+            'product_id': self.product_id,
+            'started_at': self.started_at,
+            'asking_price': self.price,
+            'rounds': self.rounds,
+            'first_offer': self.offers[0] if self.offers else None,
+            'best_offer': max(self.offers) if self.offers else None,
+            'last_counter': self.last_counter,
+            'concessions': self.concessions,
+            'outcome': self.outcome,
+            'final_price': self.final_price
+        }
+
+class NegotiationSessions:
+    """Bounded LRU store of open sessions with idle-time expiry.
+
+    Sessions leave the store when they are accepted, closed, idle for
+    longer than the TTL or pushed out by newer ones; each leaving session
+    is passed once to the `on_close(session)` callbacks. Idle sessions are
+    expired on every lookup and by the `start()` sweeper, so they are
+    persisted even when no further negotiation arrives.
+    """
+
+    def __init__(self, ttl_minutes=SESSION_TTL_MINUTES, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl_minutes * 60
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._on_close = []
+        self._lock = threading.Lock()
+
+    def on_close(self, callback):
+        self._on_close.append(callback)
+
+    def _expire(self, now):
+        # Sessions are kept in last-activity order, so expired ones are at the front
+        expired = []
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_active < self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[key]
+            if session.outcome is None:
+                session.outcome = 'expired' if now - session.last_active >= self.ttl else 'evicted'
+            expired.append(session)
+        return expired
+
+    def expire(self):
+        """Close every session idle for longer than the TTL; returns how many were closed"""
+        with self._lock:
+            closed = self._expire(time.monotonic())
+        self._closed(closed)
+        return len(closed)
+
+    def start(self, interval_seconds=SESSION_SWEEP_SECONDS):
+        """Sweep out idle sessions every interval in a background thread"""
+        def sweep_loop():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    expired = self.expire()
+                    if expired:
+                        logger.info(f"Expired {expired} idle negotiation sessions")
+                except Exception as e:
+                    logger.error(f"Error sweeping negotiation sessions: {e}")
+
+        sweep_thread = threading.Thread(target=sweep_loop, daemon=True, name='negotiation-sweeper')
+        sweep_thread.start()
+        return sweep_thread
+
+    def _open(self, user_id, product_id, terms):
+        # Call with the lock held: expire idle sessions, then find or open this one
+        key = (str(user_id), product_id)
+        closed = self._expire(time.monotonic())
+        session = self._sessions.get(key)
+        if session is None:
+            session = NegotiationSession(user_id, product_id, *terms())
+            self._sessions[key] = session
+            closed.extend(self._expire(time.monotonic()))
+        else:
+            self._sessions.move_to_end(key)
+        return session, closed
+
+    def get(self, user_id, product_id, terms):
+        """The open session for (user, product), opened with `terms()` -> (price, min_price) if there is none"""
+        with self._lock:
+            session, closed = self._open(user_id, product_id, terms)
+        self._closed(closed)
+        return session
+
+    def offer(self, user_id, product_id, offer, terms):
+        """Play one round; returns (session, outcome, quoted price)"""
+        # One lock hold from lookup to reply, so the sweeper can't close the session in between;
+        # an expired session is replaced by a fresh one
+        with self._lock:
+            session, closed = self._open(user_id, product_id, terms)
+            outcome, amount = session.respond(offer)
+            if session.closed and self._sessions.pop((session.user_id, product_id), None) is not None:
+                closed.append(session)
+        self._closed(closed)
+        return session, outcome, amount
+
+    def close(self, user_id, product_id, outcome='abandoned'):
+        """End a session without a deal"""
+        with self._lock:
+            session = self._sessions.pop((str(user_id), product_id), None)
+        if session is None:
+            return None
+        session.outcome = session.outcome or outcome
+        self._closed([session])
+        return session
+
+    def close_all(self, outcome='shutdown'):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), OrderedDict()
+        for session in sessions:
+            session.outcome = session.outcome or outcome
+        self._closed(sessions)
+
+    def _closed(self, sessions):
+        for session in sessions:
+            for callback in self._on_close:
+                try:
+                    callback(session)
+                except Exception as e:
+                    logger.error(f"Error persisting negotiation session: {e}")
+
+    def __len__(self):
+        return len(self._sessions)
+
+# Global negotiation sessions instance
+negotiation_sessions = NegotiationSessions()
+
+def get_negotiation_sessions():
+    """Get negotiation sessions instance"""
+    return negotiation_sessions
@@ -0,0 +1,195 @@
+"""
+Streaming price-drop, spike and change-point detection
+"""
+
+import os
+import math
+import threading
+from collections import deque
+import pandas as pd
+import logging
+from price_cache import load_price_frame
+from price_store import get_price_store, to_epoch_seconds
+from snapshot import register_section
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest observation in the rolling mean/variance
+ALERT_ALPHA = float(os.environ.get('ALERT_ALPHA', 0.1))
+# Standard deviations from the rolling mean that count as a drop or spike
+ALERT_Z_THRESHOLD = float(os.environ.get('ALERT_Z_THRESHOLD', 3.0))
+# Smallest move (% of the rolling mean) worth alerting on, so flat prices don't alert on cents
+ALERT_MIN_CHANGE_PCT = float(os.environ.get('ALERT_MIN_CHANGE_PCT', 2.0))
+# Observations needed before the rolling statistics are trusted
+ALERT_WARMUP = 5
+# CUSUM slack and decision threshold, in standard deviations
+CUSUM_K = 0.5
+CUSUM_H = 5.0
+RECENT_EVENTS = 1000
+
+class DetectorState:
+    """Per-product detector state; every update is O(1)"""
+
+    FIELDS = ('n', 'mean', 'var', 'cusum_up', 'cusum_down', 'min_price', 'last_epoch')
+
+    def __init__(self, n=0, mean=0.0, var=0.0, cusum_up=0.0, cusum_down=0.0, min_price=None, last_epoch=None):
+        self.n = n
+        self.mean = mean
+        self.var = var
+        self.cusum_up = cusum_up
+        self.cusum_down = cusum_down
+        self.min_price = min_price
+        self.last_epoch = last_epoch
+
+    def update(self, epoch, price):
+        """Fold in one observation and return the event types it triggers"""
+        events = []
+        if self.n == 0:
+            self.mean, self.min_price = price, price
+        else:
+            change_pct = 100.0 * (price - self.mean) / self.mean if self.mean else 0.0
+            if self.n >= ALERT_WARMUP:
+                std = math.sqrt(self.var)
+                z = (price - self.mean) / std if std > 0 else 0.0
+                significant = abs(change_pct) >= ALERT_MIN_CHANGE_PCT
+                if significant and z <= -ALERT_Z_THRESHOLD:
+                    events.append('price_drop')
+                elif significant and z >= ALERT_Z_THRESHOLD:
+                    events.append('price_spike')
+
+                # Two-sided CUSUM on standardized deviations catches sustained level shifts
+                self.cusum_up = max(0.0, self.cusum_up + z - CUSUM_K)
+                self.cusum_down = max(0.0, self.cusum_down - z - CUSUM_K)
+                if self.cusum_up > CUSUM_H or self.cusum_down > CUSUM_H:
+                    events.append('level_shift_up' if self.cusum_up > CUSUM_H else 'level_shift_down')
+                    self.cusum_up = self.cusum_down = 0.0
+
+            if price < self.min_price:
+                events.append('new_low')
+                self.min_price = price
+
+            # Exponentially weighted mean and variance
+            diff = price - self.mean
+            increment = ALERT_ALPHA * diff
+            self.mean += increment
+            self.var = (1 - ALERT_ALPHA) * (self.var + diff * increment)
+
+        self.n += 1
+        self.last_epoch = epoch
+        return events
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.FIELDS})
+
+class PriceAlerts:
+    """Runs every stored price through its product's detector and publishes the events.
+
+    Subscribers are called with one event dict per alert: product_id, type
+    (price_drop, price_spike, level_shift_up, level_shift_down, new_low),
+    timestamp, price, baseline (the rolling mean before the observation)
+    and change_pct.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._versions = {}
+        self._subscribers = []
+        self._recent = deque(maxlen=RECENT_EVENTS)
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Register `callback(event)` for every alert"""
+        self._subscribers.append(callback)
+
+    def _warm_up(self, product_id, before_epoch):
+        # Replay history older than the rows being observed, without alerting
+        state = DetectorState()
+        df = load_price_frame(product_id)
+        if df is not None and not df.empty:
+            df = df.sort_values('Timestamp', kind='stable')
+            for epoch, price in zip(to_epoch_seconds(df['Timestamp']).tolist(), df['Price'].tolist()):
+                if epoch >= before_epoch:
+                    break
+                state.update(epoch, float(price))
+        return state
+
+    def observe(self, product_id, rows, version):
+        """Price store listener: run newly stored rows through the detector"""
+        rows = rows.sort_values('Timestamp', kind='stable')
+        epochs = to_epoch_seconds(rows['Timestamp']).tolist()
+        prices = rows['Price'].astype(float).tolist()
+        if not epochs:
+            return []
+
+        with self._lock:
+            state = self._states.get(product_id)
+        if state is None:
+            state = self._warm_up(product_id, epochs[0])
+
+        events = []
+        with self._lock:
+            state = self._states.setdefault(product_id, state)
+            for epoch, price in zip(epochs, prices):
+                # Back-filled rows are older than the stream and can't be judged against it
+                if state.last_epoch is not None and epoch < state.last_epoch:
+                    continue
+                baseline = state.mean
+                for event_type in state.update(epoch, price):
+                    events.append({
+                        'product_id': product_id,
+                        'type': event_type,
+                        'timestamp': pd.Timestamp(epoch, unit='s').strftime('%Y-%m-%d %H:%M:%S'),
+                        'price': price,
+                        'baseline': round(baseline, 2),
+                        'change_pct': round(100.0 * (price - baseline) / baseline, 2) if baseline else None
+                    })
+            self._versions[product_id] = version.after
+            self._recent.extend(events)
+
+        for event in events:
+            self._publish(event)
+        return events
+
+    def _publish(self, event):
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error in price alert subscriber: {e}")
+
+    def recent_events(self, product_id=None, since=None, limit=100):
+        """Most recent events, newest last, optionally for one product and at or after a timestamp"""
+        with self._lock:
+            events = [
+                event for event in self._recent
+                if (product_id is None or event['product_id'] == product_id)
+                and (since is None or event['timestamp'] >= since)
+            ]
+        return events[-limit:]
+
+    def dump(self):
+        with self._lock:
+            return {pid: (self._versions.get(pid), state.to_dict()) for pid, state in self._states.items()}
+
+    def load(self, product_id, version, payload):
+        with self._lock:
+            self._states[product_id] = DetectorState.from_dict(payload)
+            self._versions[product_id] = version
+
+def _log_event(event):
+    logger.info(f"Price alert for {event['product_id']}: {event['type']} to {event['price']} "
+                f"(rolling mean {event['baseline']})")
+
+# Global price alerts instance
+price_alerts = PriceAlerts()
+price_alerts.subscribe(_log_event)
+get_price_store().add_listener(price_alerts.observe)
+register_section('price_alerts', price_alerts.dump, price_alerts.load)
+
+def get_price_alerts():
+    """Get price alerts instance"""
+    return price_alerts
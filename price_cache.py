@@ -0,0 +1,120 @@
+"""
+In-process cache for parsed price histories and the data derived from them
+"""
+
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+def price_history_file(product_id):
+    """Path of the CSV price history for a product"""
+    return f"price_history_{product_id}.csv"
+
+def history_version(product_id):
+    """Version token of a product's price history (mtime and size), or None if it doesn't exist"""
+    try:
+        stat = os.stat(price_history_file(product_id))
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class PriceCache:
+    """Size-bounded LRU cache of per-product derived data, keyed by history version.
+
+    Each product holds a single entry tagged with the version of its price
+    history file. Values cached under an older version are never served:
+    a version mismatch is a miss and the entry is rebuilt on demand.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, product_id, key, compute):
+        """Return the cached value of `key` for a product, computing it on a miss"""
+        version = history_version(product_id)
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is not None and entry[0] == version and key in entry[1]:
+                self._entries.move_to_end(product_id)
+                self.hits += 1
+                return entry[1][key]
+            self.misses += 1
+
+        value = compute()
+        self.put(product_id, key, value, version)
+        return value
+
+    def put(self, product_id, key, value, version):
+        """Store a value computed from the given history version"""
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None or entry[0] != version:
+                entry = (version, {})
+                self._entries[product_id] = entry
+            entry[1][key] = value
+            self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, product_id):
+        """Drop everything cached for a product"""
+        with self._lock:
+            if self._entries.pop(product_id, None) is not None:
+                self.invalidations += 1
+
+    def items(self, key):
+        """List (product_id, version, value) for every entry holding `key`"""
+        with self._lock:
+            return [
+                (product_id, version, values[key])
+                for product_id, (version, values) in self._entries.items()
+                if key in values
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and current occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+# Global price cache instance
+price_cache = PriceCache(max_entries=int(os.environ.get('PRICE_CACHE_SIZE', 256)))
+
+def get_price_cache():
+    """Get price cache instance"""
+    return price_cache
+
+def _read_price_frame(product_id):
+    filename = price_history_file(product_id)
+    if not os.path.exists(filename):
+        return None
+    df = pd.read_csv(filename)
+    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+    return df
+
+def load_price_frame(product_id):
+    """Parsed price history for a product (shared, do not mutate), or None if there is none"""
+    return price_cache.get(product_id, 'frame', lambda: _read_price_frame(product_id))
@@ -0,0 +1,249 @@
+"""
+Streaming, mergeable quantile sketches of each product's observed prices
+"""
+
+import math
+import random
+import threading
+import numpy as np
+import pandas as pd
+import logging
+from price_cache import history_version, load_price_frame
+from price_store import get_price_store
+from snapshot import register_section
+
+logger = logging.getLogger(__name__)
+
+class KLLSketch:
+    """KLL quantile sketch: approximate ranks over a stream in O(k log(n/k)) memory.
+
+    Items live in a hierarchy of compactors; an item at level h stands for
+    2**h observations. When a level overflows it is sorted and every other
+    item (random offset) is promoted to the next level.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.compactors = [[]]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _size(self):
+        return sum(len(c) for c in self.compactors)
+
+    def _max_size(self):
+        return sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _compress(self):
+        while self._size() >= self._max_size():
+            for level, items in enumerate(self.compactors):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    items.sort()
+                    # An odd item out stays behind so total weight is preserved
+                    keep = [items.pop()] if len(items) % 2 else []
+                    offset = self._rng.randint(0, 1)
+                    self.compactors[level + 1].extend(items[offset::2])
+                    self.compactors[level] = keep
+                    break
+
+    def update(self, value):
+        self.update_many([value])
+
+    def update_many(self, values):
+        values = [float(v) for v in values]
+        self.compactors[0].extend(values)
+        self.n += len(values)
+        self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.n += other.n
+        self._compress()
+
+    def rank(self, value, inclusive=True):
+        """Approximate number of observations <= value (< value if not inclusive)"""
+        total = 0
+        for level, items in enumerate(self.compactors):
+            count = sum(1 for item in items if item <= value) if inclusive else sum(1 for item in items if item < value)
+            total += count << level
+        return total
+
+    def percentile(self, value):
+        """Mid-rank percentile (0-100) of a value among the observations"""
+        if not self.n:
+            return None
+        midrank = (self.rank(value, inclusive=False) + self.rank(value)) / 2
+        return 100.0 * midrank / self.n
+
+    def percentiles(self, values):
+        """Mid-rank percentiles of many values with one search over the sorted items"""
+        values = np.asarray(values, dtype=float)
+        if not self.n:
+            return np.full(len(values), np.nan)
+        items = np.concatenate([np.asarray(c, dtype=float) for c in self.compactors])
+        weights = np.concatenate([np.full(len(c), 1 << level) for level, c in enumerate(self.compactors)])
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        cumulative = np.concatenate(([0], np.cumsum(weights[order])))
+        below = cumulative[np.searchsorted(items, values, side='left')]
+        at_or_below = cumulative[np.searchsorted(items, values, side='right')]
+        return 100.0 * (below + at_or_below) / 2 / self.n
+
+    def quantile(self, q):
+        """Approximate value at quantile q (0-1)"""
+        weighted = sorted((item, 1 << level) for level, items in enumerate(self.compactors) for item in items)
+        if not weighted:
+            return None
+        target = q * self.n
+        cumulative = 0
+        for item, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return item
+        return weighted[-1][0]
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data['k'])
+        sketch.n = data['n']
+        sketch.compactors = [list(items) for items in data['compactors']]
+        return sketch
+
+def deal_score(percentile):
+    """0-100 score of how good a price is: 100 means cheaper than anything seen so far"""
+    return None if percentile is None else round(100.0 - percentile, 1)
+
+class PriceSketches:
+    """Per-product price sketches kept current by price store writes.
+
+    The current price's percentile and deal score are recomputed once per
+    write, so request handlers read them in constant time.
+    """
+
+    def __init__(self, k=200):
+        self.k = k
+        self._products = {}
+        self._lock = threading.Lock()
+
+    def _build(self, product_id):
+        # Versioned on both sides of the read; a history that changed meanwhile gets no version
+        # and is rebuilt on its next use
+        version = history_version(product_id)
+        df = load_price_frame(product_id)
+        if df is None or df.empty:
+            return None
+        if history_version(product_id) != version:
+            version = None
+        state = {'sketch': KLLSketch(self.k), 'last_timestamp': None, 'current_price': None, 'version': version}
+        self._apply(state, df)
+        return state
+
+    @staticmethod
+    def _apply(state, rows):
+        state['sketch'].update_many(rows['Price'].tolist())
+        latest = rows['Timestamp'].idxmax()
+        if state['last_timestamp'] is None or rows['Timestamp'][latest] >= state['last_timestamp']:
+            state['last_timestamp'] = rows['Timestamp'][latest]
+            state['current_price'] = float(rows['Price'][latest])
+        state['percentile'] = state['sketch'].percentile(state['current_price'])
+
+    def _state(self, product_id):
+        version = history_version(product_id)
+        with self._lock:
+            state = self._products.get(product_id)
+        if state is None or state['version'] != version:
+            # New product, or its history changed outside the price store (e.g. edited or replaced)
+            state = self._build(product_id)
+            with self._lock:
+                if state is None:
+                    self._products.pop(product_id, None)
+                else:
+                    self._products[product_id] = state
+        return state
+
+    def observe(self, product_id, rows, version):
+        """Price store listener: fold newly stored rows into the product's sketch"""
+        with self._lock:
+            state = self._products.get(product_id)
+            if state is not None:
+                if state['version'] == version.before:
+                    self._apply(state, rows.reset_index(drop=True))
+                    state['version'] = version.after
+                elif state['version'] != version.after:
+                    # Built from some other version of the history: rebuild on next use
+                    del self._products[product_id]
+                return
+        # First sighting: build from the full history, which already includes these rows
+        self._state(product_id)
+
+    def summary(self, product_id):
+        """Percentile of the current price and its deal score"""
+        state = self._state(product_id)
+        if state is None:
+            return {'price_percentile': None, 'deal_score': None}
+        percentile = state['percentile']
+        return {
+            'price_percentile': None if percentile is None else round(percentile, 1),
+            'deal_score': deal_score(percentile)
+        }
+
+    def percentile(self, product_id, price):
+        """Percentile of an arbitrary price among the product's observations"""
+        state = self._state(product_id)
+        if state is None:
+            return None
+        with self._lock:
+            return state['sketch'].percentile(price)
+
+    def percentiles(self, product_id, prices):
+        """Percentiles of many prices among the product's observations"""
+        state = self._state(product_id)
+        if state is None:
+            return None
+        with self._lock:
+            return state['sketch'].percentiles(prices)
+
+    def dump(self):
+        with self._lock:
+            return {
+                product_id: (state['version'], {
+                    'sketch': state['sketch'].to_dict(),
+                    'last_timestamp': state['last_timestamp'].isoformat(),
+                    'current_price': state['current_price']
+                })
+                for product_id, state in self._products.items()
+            }
+
+    def load(self, product_id, version, payload):
+        sketch = KLLSketch.from_dict(payload['sketch'])
+        state = {
+            'sketch': sketch,
+            'last_timestamp': pd.Timestamp(payload['last_timestamp']),
+            'current_price': payload['current_price'],
+            'percentile': sketch.percentile(payload['current_price']),
+            'version': version
+        }
+        with self._lock:
+            self._products[product_id] = state
+
+# Global price sketches instance
+price_sketches = PriceSketches()
+get_price_store().add_listener(price_sketches.observe)
+register_section('price_sketch', price_sketches.dump, price_sketches.load)
+
+def get_price_sketches():
+    """Get price sketches instance"""
+    return price_sketches
@@ -0,0 +1,275 @@
+"""
+Time-indexed, range-bounded reads of the CSV price histories
+"""
+
+import io
+import os
+import threading
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import logging
+from price_cache import price_history_file, history_version, get_price_cache
+from snapshot import register_section
+
+logger = logging.getLogger(__name__)
+
+# History versions of a product's file just before and just after one write
+WriteVersion = namedtuple('WriteVersion', ['before', 'after'])
+
+class TimeIndex:
+    """Sorted row timestamps (epoch seconds) and the byte offset of each row in the CSV.
+
+    `offsets` has one more element than `timestamps`: the last one is the
+    indexed file size, so rows lo..hi-1 span offsets[lo]..offsets[hi].
+    """
+
+    def __init__(self, timestamps, offsets, is_sorted=True):
+        self.timestamps = timestamps
+        self.offsets = offsets
+        self.is_sorted = is_sorted
+
+    @property
+    def size(self):
+        return int(self.offsets[-1])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def slice(self, start=None, end=None, limit=None):
+        """Row range [lo, hi) for timestamps within [start, end], keeping the most recent `limit` rows"""
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, start, side='left'))
+        hi = len(self.timestamps) if end is None else int(np.searchsorted(self.timestamps, end, side='right'))
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return lo, max(lo, hi)
+
+def to_epoch_seconds(values):
+    """Convert timestamps (strings or datetimes) to int64 epoch seconds"""
+    return pd.to_datetime(values).values.astype('datetime64[s]').astype(np.int64)
+
+def _scan_rows(data, base_offset):
+    """Timestamps and start offsets of the complete CSV rows in `data`"""
+    lines = data.split(b'\n')
+    if lines and lines[-1] == b'':
+        lines.pop()
+
+    if not lines:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    lengths = np.array([len(line) + 1 for line in lines], dtype=np.int64)
+    starts = base_offset + np.cumsum(lengths) - lengths
+    timestamps = to_epoch_seconds([line.split(b',', 1)[0].decode() for line in lines])
+    return timestamps, starts.astype(np.int64)
+
+class PriceStore:
+    """Reads price history slices through a per-product time index.
+
+    Indexes are built once per product and extended incrementally as rows
+    are appended, so a range query only reads the bytes of the rows it returns.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        # Serializes writers (scraper appends and bulk ingests) to the CSV files
+        self.write_lock = threading.RLock()
+        self._listeners = []
+
+    def get_index(self, product_id):
+        """Time index for a product's history, or None if there is no history"""
+        filename = price_history_file(product_id)
+        if not os.path.exists(filename):
+            return None
+
+        with self._lock:
+            size = os.path.getsize(filename)
+            index = self._indexes.get(product_id)
+            if index is not None and index.size == size:
+                return index
+
+            with open(filename, 'rb') as f:
+                if index is not None and index.size < size and self._is_row_boundary(f, index.size):
+                    # History was appended to: index only the new rows
+                    f.seek(index.size)
+                    data = f.read(size - index.size)
+                    timestamps, starts = _scan_rows(data, index.size)
+                    timestamps = np.concatenate((index.timestamps, timestamps))
+                    offsets = np.concatenate((index.offsets[:-1], starts, [size]))
+                else:
+                    header = f.readline()
+                    data = f.read(size - len(header))
+                    timestamps, starts = _scan_rows(data, len(header))
+                    offsets = np.concatenate((starts, [size]))
+
+            is_sorted = bool(np.all(timestamps[1:] >= timestamps[:-1]))
+            if not is_sorted:
+                logger.info(f"Price history for {product_id} is not in time order - range reads fall back to full scans")
+            index = TimeIndex(timestamps, offsets.astype(np.int64), is_sorted)
+            self._indexes[product_id] = index
+            return index
+
+    @staticmethod
+    def _is_row_boundary(f, offset):
+        if offset == 0:
+            return False
+        f.seek(offset - 1)
+        return f.read(1) == b'\n'
+
+    def add_listener(self, listener):
+        """Call `listener(product_id, rows, version)` with the Timestamp/Price rows of every write.
+
+        `version` is the WriteVersion taken under the write lock, so state
+        derived from the history at `version.before` can fold the rows in and
+        become current for `version.after`, however late the listener runs.
+        """
+        self._listeners.append(listener)
+
+    def notify(self, product_id, rows, version):
+        """Publish newly stored rows to the registered listeners"""
+        for listener in self._listeners:
+            try:
+                listener(product_id, rows, version)
+            except Exception as e:
+                logger.error(f"Price listener {getattr(listener, '__name__', listener)} failed for {product_id}: {e}")
+
+    def set_index(self, product_id, index):
+        with self._lock:
+            self._indexes[product_id] = index
+
+    def invalidate(self, product_id):
+        with self._lock:
+            self._indexes.pop(product_id, None)
+
+    def read_range(self, product_id, start=None, end=None, limit=None):
+        """Price history rows within [start, end] (the last `limit` of them) as a DataFrame, or None"""
+        index = self.get_index(product_id)
+        if index is None:
+            return None
+
+        start = None if start is None else int(to_epoch_seconds([start])[0])
+        end = None if end is None else int(to_epoch_seconds([end])[0])
+
+        if not index.is_sorted:
+            df = pd.read_csv(price_history_file(product_id))
+            df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+            df = df.sort_values('Timestamp', kind='stable')
+            stamps = to_epoch_seconds(df['Timestamp'])
+            mask = np.ones(len(df), dtype=bool)
+            if start is not None:
+                mask &= stamps >= start
+            if end is not None:
+                mask &= stamps <= end
+            df = df[mask]
+            return (df.tail(limit) if limit is not None else df).reset_index(drop=True)
+
+        lo, hi = index.slice(start, end, limit)
+        if lo == hi:
+            return pd.DataFrame({'Timestamp': pd.Series(dtype='datetime64[ns]'), 'Price': pd.Series(dtype=float)})
+
+        with open(price_history_file(product_id), 'rb') as f:
+            f.seek(index.offsets[lo])
+            data = f.read(index.offsets[hi] - index.offsets[lo])
+
+        df = pd.read_csv(io.BytesIO(data), header=None, names=['Timestamp', 'Price'])
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+        return df
+
+    def write_batch(self, batches):
+        """Write new rows for several products as one unit: either every product's rows land or none do.
+
+        `batches` maps product_id -> DataFrame of Timestamp/Price rows sorted by
+        time. Rows whose timestamp is already stored are dropped. Rows newer than
+        the stored history are appended; anything older is merged into a
+        rewritten file that is only swapped in once every product is staged.
+        Returns {product_id: rows written}.
+        """
+        written = {}
+        versions = {}
+        appended = []
+        staged = []
+        with self.write_lock:
+            try:
+                for product_id, rows in batches.items():
+                    filename = price_history_file(product_id)
+                    versions[product_id] = history_version(product_id)
+                    index = self.get_index(product_id)
+                    epochs = to_epoch_seconds(rows['Timestamp'])
+
+                    if index is not None and len(index):
+                        rows = rows[~np.isin(epochs, index.timestamps)]
+                        epochs = to_epoch_seconds(rows['Timestamp'])
+                    written[product_id] = rows
+                    if not len(rows):
+                        continue
+
+                    if index is None:
+                        appended.append((product_id, filename, None))
+                        rows.to_csv(filename, index=False, date_format='%Y-%m-%d %H:%M:%S')
+                    elif not len(index) or (index.is_sorted and epochs[0] >= index.timestamps[-1]):
+                        appended.append((product_id, filename, os.path.getsize(filename)))
+                        rows.to_csv(filename, mode='a', header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+                    else:
+                        existing = pd.read_csv(filename)
+                        existing['Timestamp'] = pd.to_datetime(existing['Timestamp'])
+                        merged = pd.concat([existing, rows], ignore_index=True).sort_values('Timestamp', kind='stable')
+                        tmp_path = f"{filename}.ingest"
+                        merged.to_csv(tmp_path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+                        staged.append((product_id, filename, tmp_path))
+            except Exception:
+                # Roll back: cut appended files back to their previous size and drop staged rewrites
+                for product_id, filename, previous_size in appended:
+                    if previous_size is None:
+                        os.remove(filename)
+                    else:
+                        os.truncate(filename, previous_size)
+                    self.invalidate(product_id)
+                for _, _, tmp_path in staged:
+                    os.remove(tmp_path)
+                raise
+
+            for product_id, filename, tmp_path in staged:
+                os.replace(tmp_path, filename)
+                self.invalidate(product_id)
+            versions = {
+                product_id: WriteVersion(versions[product_id], history_version(product_id))
+                for product_id, rows in written.items() if len(rows)
+            }
+
+        for product_id, rows in written.items():
+            if len(rows):
+                get_price_cache().invalidate(product_id)
+                self.notify(product_id, rows, versions[product_id])
+        return {product_id: len(rows) for product_id, rows in written.items()}
+
+# Global price store instance
+price_store = PriceStore()
+
+def get_price_store():
+    """Get price store instance"""
+    return price_store
+
+# Snapshot section: time indexes
+def _dump_time_indexes():
+    dumped = {}
+    with price_store._lock:
+        indexes = list(price_store._indexes.items())
+    for product_id, index in indexes:
+        version = history_version(product_id)
+        if version is None or version[1] != index.size:
+            continue
+        dumped[product_id] = (version, {
+            'timestamps': index.timestamps.tolist(),
+            'offsets': index.offsets.tolist(),
+            'sorted': index.is_sorted
+        })
+    return dumped
+
+def _load_time_index(product_id, version, payload):
+    price_store.set_index(product_id, TimeIndex(
+        np.asarray(payload['timestamps'], dtype=np.int64),
+        np.asarray(payload['offsets'], dtype=np.int64),
+        payload['sorted']
+    ))
+
+register_section('time_index', _dump_time_indexes, _load_time_index)
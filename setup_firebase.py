@@ -105,6 +105,32 @@ FIREBASE_DATABASE_URL={config['databaseURL']}
         print(f"❌ Error creating .env file: {e}")
         return False
 
+# Indexes for the child queries the app and its scripts run; key-ordered reads need none
+DATABASE_INDEXES = {
+    "negotiations": {".indexOn": ["user_id", "product_id", "timestamp"]},
+    "negotiations_by_user": {"$uid": {".indexOn": ["timestamp"]}},
+    "negotiations_by_product": {"$product_id": {".indexOn": ["timestamp"]}},
+    "price_history": {"$product_id": {".indexOn": ["timestamp"]}}
+}
+
+def database_rules(production=False):
+    """Realtime Database rules, including the indexes"""
+    rules = json.loads(json.dumps(DATABASE_INDEXES))
+    if production:
+        rules["users"] = {
+            "$uid": {
+                ".read": "auth != null && auth.uid == $uid",
+                ".write": "auth != null && auth.uid == $uid"
+            }
+        }
+        rules["users_by_email"] = {
+            ".read": "auth != null",
+            ".write": "auth != null"
+        }
+    else:
+        rules = {".read": True, ".write": True, **rules}
+    return {"rules": rules}
+
 def setup_database_rules():
     """Provide instructions for setting up database rules"""
     print("\n🔒 Database Security Rules Setup")
@@ -113,28 +139,10 @@ def setup_database_rules():
     print("Replace the rules with one of these options:")
     print()
     print("For Development (Test Mode):")
-    print('''{
-  "rules": {
-    ".read": true,
-    ".write": true
-  }
-}''')
+    print(json.dumps(database_rules(), indent=2))
     print()
     print("For Production (Secure):")
-    print('''{
-  "rules": {
-    "users": {
-      "$uid": {
-        ".read": "auth != null && auth.uid == $uid",
-        ".write": "auth != null && auth.uid == $uid"
-      }
-    },
-    "users_by_email": {
-      ".read": "auth != null",
-      ".write": "auth != null"
-    }
-  }
-}''')
+    print(json.dumps(database_rules(production=True), indent=2))
 
 def main():
     """Main setup function"""
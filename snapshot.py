@@ -0,0 +1,129 @@
+"""
+Warm-start snapshot of derived price state for fast restarts
+"""
+
+import os
+import sys
+import json
+import signal
+import atexit
+import threading
+import time
+from datetime import datetime
+import logging
+from price_cache import get_price_cache, history_version
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_FILE = os.environ.get('SNAPSHOT_FILE', 'derived_state.json')
+
+# Registered snapshot sections: name -> (dump, load)
+_sections = {}
+_write_lock = threading.Lock()
+
+def register_section(name, dump, load):
+    """Register a piece of derived state to be included in the snapshot.
+
+    `dump()` returns {product_id: (history_version, payload)} with a JSON
+    serializable payload. `load(product_id, version, payload)` is only called
+    for products whose history version still matches the one recorded.
+    """
+    _sections[name] = (dump, load)
+
+def save_snapshot(path=None):
+    """Write all registered sections to the snapshot file"""
+    path = path or SNAPSHOT_FILE
+    with _write_lock:
+        try:
+            sections = {}
+            for name, (dump, _) in _sections.items():
+                sections[name] = {
+                    product_id: {'version': list(version), 'data': payload}
+                    for product_id, (version, payload) in dump().items()
+                    if version is not None
+                }
+
+            snapshot = {
+                'format': SNAPSHOT_FORMAT,
+                'created_at': datetime.now().isoformat(),
+                'sections': sections
+            }
+
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+            logger.info(f"Snapshot written to {path} ({', '.join(f'{n}: {len(s)}' for n, s in sections.items())})")
+            return True
+        except Exception as e:
+            logger.error(f"Error writing snapshot: {e}")
+            return False
+
+def load_snapshot(path=None):
+    """Restore registered sections from the snapshot file, skipping stale products"""
+    path = path or SNAPSHOT_FILE
+    try:
+        if not os.path.exists(path):
+            logger.info("No snapshot found - starting cold")
+            return False
+
+        with open(path, 'r') as f:
+            snapshot = json.load(f)
+
+        if snapshot.get('format') != SNAPSHOT_FORMAT:
+            logger.info(f"Ignoring snapshot with format {snapshot.get('format')}")
+            return False
+
+        loaded, stale = 0, 0
+        for name, entries in snapshot.get('sections', {}).items():
+            if name not in _sections:
+                continue
+            _, load = _sections[name]
+            for product_id, entry in entries.items():
+                version = tuple(entry['version'])
+                if history_version(product_id) != version:
+                    stale += 1
+                    continue
+                try:
+                    load(product_id, version, entry['data'])
+                    loaded += 1
+                except Exception as e:
+                    logger.error(f"Error restoring {name} for {product_id} from snapshot: {e}")
+                    stale += 1
+
+        logger.info(f"Snapshot from {snapshot.get('created_at')} loaded: {loaded} entries restored, {stale} stale")
+        return True
+    except Exception as e:
+        logger.error(f"Error loading snapshot: {e}")
+        return False
+
+def start_snapshot_writer(interval_minutes=10):
+    """Write the snapshot periodically and on graceful shutdown"""
+    def snapshot_loop():
+        while True:
+            time.sleep(interval_minutes * 60)
+            save_snapshot()
+
+    atexit.register(save_snapshot)
+
+    # Turn SIGTERM into a normal interpreter exit so the atexit hook runs
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    snapshot_thread = threading.Thread(target=snapshot_loop, daemon=True)
+    snapshot_thread.start()
+    return snapshot_thread
+
+# Price cache section: aggregates
+def _dump_price_cache():
+    return {
+        product_id: (version, {'stats': [None if v is None else float(v) for v in value]})
+        for product_id, version, value in get_price_cache().items('stats')
+    }
+
+def _load_price_cache(product_id, version, payload):
+    if 'stats' in payload:
+        get_price_cache().put(product_id, 'stats', tuple(payload['stats']), version)
+
+register_section('price_cache', _dump_price_cache, _load_price_cache)
@@ -0,0 +1,116 @@
+"""
+Cache-friendly static asset serving: content-hashed URLs, conditional requests and precompressed variants
+"""
+
+import os
+import re
+import hashlib
+import mimetypes
+import threading
+from flask import request, send_file, abort, url_for
+from werkzeug.utils import safe_join
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Precompressed variants in order of preference: (Content-Encoding, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+HASHED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+
+_hash_cache = {}
+_hash_lock = threading.Lock()
+
+def content_hash(path):
+    """Short content hash of a file, cached by mtime and size"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _hash_lock:
+        cached = _hash_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    value = digest.hexdigest()[:12]
+
+    with _hash_lock:
+        _hash_cache[path] = (key, value)
+    return value
+
+def hashed_filename(static_folder, filename):
+    """`name.ext` -> `name.<contenthash>.ext`, or the plain name if the file doesn't exist"""
+    path = safe_join(static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{content_hash(path)}{ext}"
+
+def _accepted_encodings():
+    header = request.headers.get('Accept-Encoding', '')
+    return {part.split(';')[0].strip().lower() for part in header.split(',') if part.strip()}
+
+def serve_asset(static_folder, filename):
+    """Serve a static file with ETag/Last-Modified validation, immutable caching for hashed names
+    and a precompressed .br/.gz variant when the client accepts one"""
+    immutable = False
+    match = HASHED_NAME.match(filename)
+    if match:
+        plain = f"{match.group('stem')}{match.group('ext')}"
+        plain_path = safe_join(static_folder, plain)
+        if plain_path is not None and os.path.isfile(plain_path):
+            # Only a URL whose hash matches the current content may be cached forever
+            immutable = content_hash(plain_path) == match.group('hash')
+            filename = plain
+
+    path = safe_join(static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    etag = content_hash(path)
+    mimetype_source = path
+    encoding = None
+    accepted = _accepted_encodings()
+    for name, suffix in ENCODINGS:
+        variant = path + suffix
+        if name in accepted and os.path.isfile(variant) and os.path.getmtime(variant) >= os.path.getmtime(path):
+            path, encoding = variant, name
+            etag = f"{etag}-{name}"
+            break
+
+    response = send_file(
+        path,
+        mimetype=_guess_mimetype(mimetype_source),
+        conditional=True,
+        etag=etag,
+        last_modified=os.path.getmtime(path)
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    return response
+
+def _guess_mimetype(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+def init_static_assets(app):
+    """Serve the app's static folder through serve_asset and expose `asset_url` to templates"""
+    static_folder = app.static_folder
+
+    def static(filename):
+        return serve_asset(static_folder, filename)
+
+    # Replace Flask's default static view so url_for('static', ...) keeps working
+    app.view_functions['static'] = static
+
+    def asset_url(filename):
+        return url_for('static', filename=hashed_filename(static_folder, filename))
+
+    app.jinja_env.globals['asset_url'] = asset_url
+    return asset_url
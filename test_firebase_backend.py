@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test script to verify Firebase storage against the in-memory Realtime Database backend (no credentials needed)
+"""
+
+def test_firebase_backend():
+    """Test batched writes, queries and injected failures"""
+    print("🧪 Testing In-Memory Firebase Backend")
+    print("=" * 40)
+
+    import firebase_config
+    from firebase_backend import InMemoryRealtimeBackend
+
+    # Write synchronously so reads see every write
+    firebase_config.OUTBOX = False
+    firebase_config.WRITE_BEHIND = False
+    service = firebase_config.FirebaseService()
+    service.use_backend(InMemoryRealtimeBackend(seed=0))
+
+    print("1. Testing batched writes...")
+    with service.batch() as batch:
+        service.save_product_data("P1", {'name': 'Phone', 'current_price': 100}, batch=batch)
+        service.save_product_metadata("P1", {'category': 'phones'}, batch=batch)
+        service.save_user_activity("u1", 'add_product', {'product_id': "P1"}, batch=batch)
+    assert service.backend.stats['writes'] == 1
+    print("✅ A unit of work is a single update")
+
+    print("\n2. Testing queries...")
+    for i in range(6):
+        service.save_negotiation("u1" if i % 2 else "u2", "P1" if i < 4 else "P2", {'offer': i})
+    user_data = service.get_user_data("u1")
+    assert sorted(n['offer'] for n in user_data['negotiations'].values()) == [1, 3, 5]
+    analytics = service.get_product_analytics("P1")
+    assert len(analytics['negotiations']) == 4
+    assert analytics['metadata']['category'] == 'phones'
+    latest = service.backend.get('negotiations', order_by='$key', limit_to_last=2)
+    assert [n['offer'] for n in latest.values()] == [4, 5]
+    print("✅ Child, key and limit queries match")
+
+    print("\n3. Testing injected failures...")
+    service.backend.fail_next()
+    assert service.save_negotiation("u1", "P1", {'offer': 9}) is False
+    assert len(service.get_user_data("u1")['negotiations']) == 3
+    print("✅ A failed write leaves nothing behind")
+
+    print("\n4. Testing cursor pagination...")
+    for i in range(7):
+        service.save_user_activity("u3", 'view', {'i': i})
+    seen, cursor = [], None
+    while True:
+        page = service.get_user_data_page("u3", 'activities', cursor, limit=3)
+        seen += [record['i'] for record in reversed(list(page['items'].values()))]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [6, 5, 4, 3, 2, 1, 0]
+    assert service.get_user_data_summary("u3") == {'inputs': {}, 'activities': 7, 'negotiations': 0}
+    print("✅ Pages walk back through every record once")
+
+    print("\n🎉 Firebase backend test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    test_firebase_backend()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the durable Firebase outbox against the in-memory Realtime Database backend
+"""
+
+def test_firebase_outbox():
+    """Test ordered replay, replay after restart, a single replayer per file, rejected writes and outages"""
+    print("🧪 Testing Firebase Outbox")
+    print("=" * 40)
+
+    import os
+    import time
+    import tempfile
+    import firebase_outbox
+    from firebase_backend import InMemoryRealtimeBackend
+    from firebase_outbox import FirebaseOutbox, RECEIPTS_PATH
+
+    directory = tempfile.mkdtemp()
+    backend = InMemoryRealtimeBackend(seed=0)
+    sent = []
+
+    def write(updates):
+        backend.update(updates)
+        sent.append([path for path in updates if not path.startswith(RECEIPTS_PATH)])
+
+    def outbox(name):
+        return FirebaseOutbox(write, read=lambda path, **query: backend.get(path, **query),
+                              path=os.path.join(directory, name))
+
+    print("1. Testing ordered replay...")
+    first = outbox('ordered.db')
+    for i in range(5):
+        first.append({'counter': i, f'log/{i}': i})
+    first.start()
+    assert first.flush(timeout=5)
+    assert backend.get('counter') == 4
+    delivered = [path for paths in sent for path in paths if path.startswith('log/')]
+    assert delivered == [f'log/{i}' for i in range(5)]
+    first.release()
+    print("✅ Writes to one path land in the order they were stored")
+
+    print("\n2. Testing replay after restart...")
+    sent.clear()
+    crashed = outbox('restart.db')
+    crashed.append({'items/a': 1})
+    crashed.append({'items/b': 2})
+    # Sent but not deleted, as if the process died right after the write
+    batch, seqs, receipts = crashed._next_batch()
+    write({**batch, **{path: time.time() for path in receipts}})
+    crashed.append({'items/c': 3})
+    sent.clear()
+    restarted = outbox('restart.db').start()
+    assert restarted.flush(timeout=5)
+    assert sent == [['items/c']]
+    assert backend.get('items') == {'a': 1, 'b': 2, 'c': 3}
+    restarted.release()
+    print("✅ Entries already applied before the restart are not sent again")
+
+    print("\n3. Testing a single replayer...")
+    sent.clear()
+    one, two = outbox('shared.db'), outbox('shared.db')
+    one.start()
+    two.start()
+    deadline = time.monotonic() + 5
+    while (one.leader is None or two.leader is None) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [one.leader, two.leader].count(True) == 1
+    leader = one if one.leader else two
+    for i in range(20):
+        (one if i % 2 else two).append({f'shared/{i}': i})
+    while leader.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert leader.pending() == 0
+    delivered = sorted(path for paths in sent for path in paths)
+    assert delivered == sorted(f'shared/{i}' for i in range(20))
+    print("✅ Both instances store writes, one delivers each exactly once")
+
+    print("\n4. Testing a rejected write...")
+    sent.clear()
+    leader.append({'poison/ok1': 1})
+    leader.append({'poison/bad': float('nan')})
+    leader.append({'poison/ok2': 2})
+    assert leader.flush(timeout=5)
+    assert backend.get('poison') == {'ok1': 1, 'ok2': 2}
+    dead = leader.dead_letters()
+    assert [list(entry['updates']) for entry in dead] == [['poison/bad']]
+    assert leader.stats['dead'] == 1
+    one.release()
+    two.release()
+    print("✅ The bad write is set aside and the ones behind it go through")
+
+    print("\n5. Testing an outage that is not an OSError...")
+    class TransportError(Exception):
+        """Stands in for google.auth.exceptions.TransportError, which firebase_admin does not wrap"""
+
+    outage = {'left': 3}
+    def flaky(updates):
+        if outage['left']:
+            outage['left'] -= 1
+            raise TransportError("token refresh failed")
+        write(updates)
+
+    original_backoff = firebase_outbox.BACKOFF_SECONDS
+    firebase_outbox.BACKOFF_SECONDS = 0.01
+    sent.clear()
+    recovering = FirebaseOutbox(flaky, read=lambda path, **query: backend.get(path, **query),
+                                path=os.path.join(directory, 'outage.db'))
+    recovering.append({'outage/a': 1})
+    recovering.append({'outage/b': 2})
+    recovering.start()
+    try:
+        assert recovering.flush(timeout=5)
+    finally:
+        firebase_outbox.BACKOFF_SECONDS = original_backoff
+    assert backend.get('outage') == {'a': 1, 'b': 2}
+    assert recovering.dead_letters() == [] and recovering.stats['retries'] == 3
+    recovering.release()
+    print("✅ Unrecognised failures are retried, nothing is dead-lettered")
+
+    print("\n🎉 Firebase outbox test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    test_firebase_outbox()
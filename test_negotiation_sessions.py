@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script to verify multi-round negotiation sessions: concessions, acceptance and idle expiry
+"""
+
+def test_negotiation_sessions():
+    """Test the concession rules and TTL expiry"""
+    print("🧪 Testing Negotiation Sessions")
+    print("=" * 40)
+
+    import time
+    import negotiation_sessions
+    from negotiation import COUNTER, ACCEPT_OFFER, FINAL_OFFER
+    from negotiation_sessions import NegotiationSessions
+
+    terms = lambda: (100.0, 80.0)
+
+    print("1. Testing concessions...")
+    sessions = NegotiationSessions()
+    session, outcome, first = sessions.offer("u1", "P1", 72, terms)
+    assert outcome == COUNTER and first == 86.0
+    _, outcome, amount = sessions.offer("u1", "P1", 72, terms)
+    assert (outcome, amount) == (COUNTER, first) and session.concessions == 0
+    _, outcome, amount = sessions.offer("u1", "P1", 70, terms)
+    assert (outcome, amount) == (COUNTER, first) and session.concessions == 0
+    _, outcome, amount = sessions.offer("u1", "P1", 76, terms)
+    assert outcome == COUNTER and 80.0 <= amount < first and session.concessions == 1
+    _, outcome, amount = sessions.offer("u1", "P1", 79.5, terms)
+    assert amount == 80.0
+    print("✅ Only a higher offer earns a concession, never below the floor")
+
+    print("\n2. Testing acceptance...")
+    closed = []
+    sessions.on_close(closed.append)
+    _, outcome, amount = sessions.offer("u1", "P1", 80, terms)
+    assert (outcome, amount) == (ACCEPT_OFFER, 80)
+    assert closed == [session] and session.outcome == 'accepted' and len(sessions) == 0
+    print("✅ Meeting the counter closes the session once")
+
+    print("\n3. Testing the round limit...")
+    original_rounds = negotiation_sessions.MAX_ROUNDS
+    negotiation_sessions.MAX_ROUNDS = 2
+    try:
+        sessions.offer("u2", "P1", 72, terms)
+        sessions.offer("u2", "P1", 74, terms)
+        _, outcome, _ = sessions.offer("u2", "P1", 76, terms)
+        assert outcome == FINAL_OFFER
+    finally:
+        negotiation_sessions.MAX_ROUNDS = original_rounds
+    print("✅ The seller stops conceding after the last round")
+
+    print("\n4. Testing idle expiry...")
+    closed.clear()
+    sessions.ttl = 0.05
+    session, _, _ = sessions.offer("u3", "P2", 72, terms)
+    sessions.start(interval_seconds=0.02)
+    deadline = time.monotonic() + 2
+    while len(sessions) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert len(sessions) == 0
+    assert {s.outcome for s in closed} == {'expired'} and session in closed
+    fresh, _, _ = sessions.offer("u3", "P2", 72, terms)
+    assert fresh is not session and fresh.rounds == 1
+    print("✅ The sweeper closes idle sessions without another request")
+
+    print("\n🎉 Negotiation sessions test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    test_negotiation_sessions()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script to verify cached and range-bounded price history reads (no server needed)
+"""
+
+import os
+import tempfile
+import pandas as pd
+
+def test_price_store():
+    """Test time-indexed range reads and cache invalidation on append"""
+    print("🧪 Testing Price Store")
+    print("=" * 40)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            from amazon_scraper import save_price_data
+            from price_cache import get_price_cache, load_price_frame
+            from price_store import get_price_store
+
+            product_id = "TESTSTORE1"
+            rows = pd.DataFrame({
+                'Timestamp': pd.date_range('2025-01-01', periods=40, freq='D').strftime('%Y-%m-%d %H:%M:%S'),
+                'Price': [100.0 + i for i in range(40)]
+            })
+            rows.to_csv(f"price_history_{product_id}.csv", index=False)
+
+            print("1. Testing range reads...")
+            store = get_price_store()
+            df = store.read_range(product_id, start=pd.Timestamp('2025-01-10'), end=pd.Timestamp('2025-01-12'))
+            assert df['Price'].tolist() == [109.0, 110.0, 111.0]
+            df = store.read_range(product_id, limit=2)
+            assert df['Price'].tolist() == [138.0, 139.0]
+            df = store.read_range(product_id, start=pd.Timestamp('2030-01-01'))
+            assert len(df) == 0
+            print("✅ Range reads return the requested slice")
+
+            print("\n2. Testing cache invalidation on append...")
+            assert len(load_price_frame(product_id)) == 40
+            assert len(load_price_frame(product_id)) == 40
+            hits = get_price_cache().stats()['hits']
+            assert hits >= 1
+            save_price_data(product_id, 42.0)
+            assert len(load_price_frame(product_id)) == 41
+            df = store.read_range(product_id, limit=1)
+            assert df['Price'].tolist() == [42.0]
+            assert len(store.get_index(product_id)) == 41
+            print("✅ Appends invalidate the cache and extend the time index")
+        finally:
+            os.chdir(cwd)
+
+    print("\n🎉 Price store test completed successfully!")
+    return True
+
+def test_write_batch():
+    """Test merge-rewrites of out-of-order and duplicate rows, and rollback of a failed batch"""
+    print("🧪 Testing Price Store Batch Writes")
+    print("=" * 40)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            from price_cache import load_price_frame
+            from price_store import get_price_store
+
+            def history(product_id, start, periods):
+                rows = pd.DataFrame({
+                    'Timestamp': pd.date_range(start, periods=periods, freq='D'),
+                    'Price': [100.0 + i for i in range(periods)]
+                })
+                rows.to_csv(f"price_history_{product_id}.csv", index=False, date_format='%Y-%m-%d %H:%M:%S')
+
+            store = get_price_store()
+            history("TESTMERGE1", '2025-01-01', 10)
+
+            print("1. Testing out-of-order and duplicate rows...")
+            rows = pd.DataFrame({
+                'Timestamp': pd.to_datetime(['2025-01-03 12:00:00', '2025-01-05 00:00:00', '2025-01-20 00:00:00']),
+                'Price': [50.0, 999.0, 60.0]
+            })
+            written = store.write_batch({"TESTMERGE1": rows})
+            assert written == {"TESTMERGE1": 2}
+            df = load_price_frame("TESTMERGE1")
+            assert len(df) == 12
+            assert df['Timestamp'].is_monotonic_increasing
+            assert 999.0 not in df['Price'].tolist()
+            df = store.read_range("TESTMERGE1", start=pd.Timestamp('2025-01-03'), end=pd.Timestamp('2025-01-04'))
+            assert df['Price'].tolist() == [102.0, 50.0, 103.0]
+            print("✅ Older rows are merged in order and stored timestamps are skipped")
+
+            print("\n2. Testing rollback of a failed batch...")
+            history("TESTAPPEND", '2025-01-01', 5)
+            history("TESTREWRITE", '2025-01-01', 5)
+            sizes = {pid: os.path.getsize(f"price_history_{pid}.csv") for pid in ("TESTAPPEND", "TESTREWRITE")}
+            broken = pd.DataFrame({'Timestamp': ['not a timestamp'], 'Price': [1.0]})
+            try:
+                store.write_batch({
+                    "TESTAPPEND": pd.DataFrame({'Timestamp': pd.to_datetime(['2025-02-01']), 'Price': [1.0]}),
+                    "TESTREWRITE": pd.DataFrame({'Timestamp': pd.to_datetime(['2024-12-01']), 'Price': [2.0]}),
+                    "TESTBROKEN": broken
+                })
+                assert False, "write_batch should have failed"
+            except AssertionError:
+                raise
+            except Exception:
+                pass
+            for pid, size in sizes.items():
+                assert os.path.getsize(f"price_history_{pid}.csv") == size
+                assert len(load_price_frame(pid)) == 5
+            assert not [name for name in os.listdir('.') if name.endswith('.ingest')]
+            assert not os.path.exists("price_history_TESTBROKEN.csv")
+            print("✅ Appends are truncated and staged rewrites dropped")
+        finally:
+            os.chdir(cwd)
+
+    print("\n🎉 Price store batch write test completed successfully!")
+    return True
+
+if __name__ == "__main__":
+    test_price_store()
+    test_write_batch()